@@ -31,9 +31,6 @@ def get_all_users():
         users = cursor.fetchall()
 
         for user in users:
-            if user.get('created_at'):
-                user['created_at'] = user['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-
             # 這裡可以針對新角色做額外處理（例如顯示名稱轉換）
             if user.get('role') == 'ta':
                 user['role_display'] = '科助'
@@ -100,10 +97,6 @@ def search_users():
         cursor.execute(sql, params)
         users = cursor.fetchall()
 
-        for user in users:
-            if user.get('created_at'):
-                user['created_at'] = user['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-
         return jsonify({"success": True, "users": users})
     except Exception as e:
         print(f"搜尋用戶錯誤: {e}")
@@ -1,10 +1,28 @@
 from flask import Blueprint, request, jsonify, render_template, session
 from config import get_db
+from catalog_cache import read_version, bump_version
+from page_cache import cached_page
 from datetime import datetime
 import traceback
 
 announcement_bp = Blueprint("announcement_bp", __name__)
 
+
+def announcement_version_key(aid):
+    """cache_versions 中公告的版本名稱；公告修改 / 刪除時遞增，公告頁快取隨之失效"""
+    return f"announcement:{aid}"
+
+
+def _announcement_version(aid):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        return read_version(cursor, announcement_version_key(aid))
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # ------------------------------------------------------------
 # 頁面
 # ------------------------------------------------------------
@@ -49,6 +67,7 @@ def list_announcements():
 # 頁面：公告詳情
 # ------------------------------------------------------------
 @announcement_bp.route("/view_announcement/<int:aid>")
+@cached_page(version=_announcement_version, max_age=0)
 def view_announcement(aid):
     """公告詳情頁"""
     try:
@@ -127,6 +146,7 @@ def update_announcement(aid):
             SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
             WHERE id=%s
         """, (title, content, start_time, end_time, is_published, aid))
+        bump_version(cursor, announcement_version_key(aid))
         conn.commit()
 
         # 若更新後設為已發布 → 推播通知
@@ -150,6 +170,7 @@ def delete_announcement(aid):
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM announcement WHERE id=%s", (aid,))
+        bump_version(cursor, announcement_version_key(aid))
         conn.commit()
         return jsonify({"success": True, "message": "公告已刪除"})
     except Exception:
@@ -1,80 +1,141 @@
 from flask import Flask, redirect, url_for, session
 from flask_cors import CORS
-from jinja2 import ChoiceLoader, FileSystemLoader
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, FileSystemLoader
+from json_provider import OrjsonProvider
+from compression import init_compression
+from static_assets import init_static_assets
 
 import os
 
+# 路徑一律以本檔案位置為準，不受啟動時的工作目錄影響
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BASE_DIR)
+FRONTEND_DIR = os.path.join(PROJECT_DIR, "frontend")
+ADMIN_TEMPLATE_DIR = os.path.join(PROJECT_DIR, "admin_frontend", "templates")
+# 瀏覽器快取 CORS preflight 的秒數（Chrome 上限 7200）
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", "7200"))
+# 編譯後的模板（所有 worker 共用；部署時先以 precompile_templates.py 產生）
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(BASE_DIR, "jinja_cache"))
+
+
 # -------------------------
 # 建立 Flask app
 # -------------------------
-app = Flask(
-    __name__,
-    static_folder='../frontend/static',
-    template_folder='../frontend/templates'
-)
+def create_app():
+    app = Flask(
+        __name__,
+        static_folder=os.path.join(FRONTEND_DIR, "static"),
+        template_folder=os.path.join(FRONTEND_DIR, "templates")
+    )
 
-# secret_key 與檔案設定
-app.secret_key = os.getenv("SECRET_KEY", "your_secret_key")
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), "uploads")
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # jsonify 使用 orjson（datetime 直接輸出成 "%Y-%m-%d %H:%M:%S"）
+    app.json = OrjsonProvider(app)
 
-# CORS
-CORS(app, supports_credentials=True)
+    # secret_key 與檔案設定
+    app.secret_key = os.getenv("SECRET_KEY", "your_secret_key")
+    app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, "uploads")
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# -------------------------
-# Jinja2 載入前台 + 管理員模板
-# -------------------------
-app.jinja_loader = ChoiceLoader([
-    app.jinja_loader,
-    FileSystemLoader('../admin_frontend/templates')
-])
+    # CORS（preflight 結果由瀏覽器快取 CORS_MAX_AGE 秒）
+    # 允許帶 cookie 時會回傳請求的 Origin，快取須依 Origin 區分；
+    # after_request 依註冊的相反順序執行，須在 CORS() 之前註冊才看得到 CORS 標頭
+    @app.after_request
+    def vary_on_origin(response):
+        if response.headers.get("Access-Control-Allow-Origin", "*") != "*":
+            response.vary.add("Origin")
+        return response
 
-# -------------------------
-# 載入 Blueprint
-# -------------------------
-from auth import auth_bp
-from company import company_bp
-from resume import resume_bp
-from admin import admin_bp
-from users import users_bp
-from notification import notification_bp
-from preferences import preferences_bp
-from announcement import announcement_bp
-
-
-# 註冊 Blueprint
-app.register_blueprint(auth_bp)
-app.register_blueprint(company_bp)
-app.register_blueprint(resume_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(users_bp)
-app.register_blueprint(notification_bp)
-app.register_blueprint(preferences_bp)
-app.register_blueprint(announcement_bp, url_prefix="/announcement")
+    CORS(app, supports_credentials=True, max_age=CORS_MAX_AGE)
+
+    # 回應壓縮（br / gzip）與預先壓縮的靜態檔
+    init_compression(app)
+
+    # 帶內容雜湊的靜態檔網址（manifest.json）與長期快取
+    init_static_assets(app)
+
+    # -------------------------
+    # Jinja2 載入前台 + 管理員模板
+    # -------------------------
+    app.jinja_loader = ChoiceLoader([
+        app.jinja_loader,
+        FileSystemLoader(ADMIN_TEMPLATE_DIR)
+    ])
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+    # -------------------------
+    # 載入 Blueprint
+    # -------------------------
+    from auth import auth_bp
+    from company import company_bp
+    from resume import resume_bp
+    from admin import admin_bp
+    from users import users_bp
+    from notification import notification_bp
+    from preferences import preferences_bp
+    from announcement import announcement_bp
+    from batch import batch_bp
+
+    # 註冊 Blueprint
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(company_bp)
+    app.register_blueprint(resume_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(users_bp)
+    app.register_blueprint(notification_bp)
+    app.register_blueprint(preferences_bp)
+    app.register_blueprint(announcement_bp, url_prefix="/announcement")
+    app.register_blueprint(batch_bp)
+
+    # -------------------------
+    # 首頁路由（使用者前台）
+    # -------------------------
+    @app.route("/")
+    def index():
+        if "username" in session and session.get("role") == "student":
+            return redirect(url_for("users_bp.student_home"))
+        return redirect(url_for("auth_bp.login_page"))
+
+    # -------------------------
+    # 管理員首頁（後台）
+    # -------------------------
+    @app.route("/admin")
+    def admin_index():
+        if "username" in session and session.get("role") == "admin":
+            return redirect(url_for("admin_bp.admin_home"))
+        return redirect(url_for("auth_bp.login_page"))
+
+    return app
 
-# -------------------------
-# 首頁路由（使用者前台）
-# -------------------------
-@app.route("/")
-def index():
-    if "username" in session and session.get("role") == "student":
-        return redirect(url_for("users_bp.student_home")) 
-    return redirect(url_for("auth_bp.login_page"))
 
 # -------------------------
-# 管理員首頁（後台）
+# 預熱（正式環境在 fork worker 之前執行一次）
 # -------------------------
-@app.route("/admin")
-def admin_index():
-    if "username" in session and session.get("role") == "admin":
-        return redirect(url_for("admin_bp.admin_home"))
-    return redirect(url_for("auth_bp.login_page"))
+def warm_up(app):
+    """
+    載入所有模板（bytecode cache 有就直接讀，沒有就編譯並寫入）
+    回傳 (成功數, 失敗的模板名稱 list)
+    """
+    count, failed = 0, []
+    for name in app.jinja_env.list_templates(extensions=("html",)):
+        try:
+            app.jinja_env.get_template(name)
+            count += 1
+        except Exception as e:
+            print(f"❌ 模板預先編譯失敗：{name}：{e}")
+            failed.append(name)
+    return count, failed
+
 
 # -------------------------
-# 主程式入口
+# 主程式入口（開發用；正式環境請用 gunicorn -c gunicorn.conf.py）
 # -------------------------
 if __name__ == "__main__":
+    from schema import ensure_schema
+    from preference_buffer import recover_journals
+    ensure_schema()
+    recover_journals()
     try:
-        app.run(host="0.0.0.0", port=5000, debug=True)
+        create_app().run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG", "1") == "1")
     except (KeyboardInterrupt, SystemExit):
         pass  # No scheduler to shut down
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for
 from werkzeug.security import check_password_hash, generate_password_hash
 from config import get_db
+from page_cache import cached_page
 import json
 import re
 
@@ -231,6 +232,7 @@ def index_page():
   
 #登入
 @auth_bp.route("/login")
+@cached_page()
 def login_page():
     return render_template("auth/login.html")
 
@@ -251,14 +253,14 @@ def login_confirm_page():
   
 # 訪客首頁頁面（不需登入）
 @auth_bp.route("/visitor_home")
+@cached_page()
 def visitor_home():
-    # 不驗證 session，允許訪客進入
-    session["role"] = "guest"
-    session["username"] = "guest"
+    # 不驗證、也不建立 session，允許訪客進入（頁面可由 proxy 快取）
     return render_template("user_shared/visitor_home.html")
   
 # 學生註冊
 @auth_bp.route("/register_student")
+@cached_page()
 def show_register_student_page():
     return render_template("auth/register_student.html")
 
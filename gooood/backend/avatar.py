@@ -0,0 +1,154 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# =========================================================
+# 頭像處理
+#   - 上傳的圖片先解碼驗證（只接受 PNG / JPEG / GIF / WebP），依 EXIF 轉正後裁成正方形，
+#     縮成 SIZES 中的幾種尺寸，各輸出 WebP 與 JPEG（fallback）；重新編碼時不保留 EXIF 等中繼資料
+#   - 檔名為原始檔內容雜湊：avatars/sized/<雜湊>-<尺寸>.<webp|jpg>，
+#     內容與網址一一對應，以 immutable 長期快取（static_assets）
+#   - 解碼 / 縮圖在程序池中執行，不佔用處理請求的執行緒，也限制同時處理的張數
+#   - users.avatar_url 存 md 尺寸的 WebP；其他尺寸由 avatar_variants() 推得
+#   - 相同圖片共用檔案：save_avatar() 沿用既有檔案時會更新其修改時間；
+#     remove_avatar() 不刪除確認無人使用之後才被用過的檔案，避免刪掉剛被別人選用的頭像
+# =========================================================
+
+AVATAR_DIR = "avatars/sized"
+SIZES = {"sm": 64, "md": 128, "lg": 256}
+DEFAULT_SIZE = "md"
+FORMATS = {"webp": ("WEBP", {"quality": 82, "method": 4}), "jpg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True})}
+DEFAULT_FORMAT = "webp"
+
+ALLOWED_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000         # 超過視為異常圖片（decompression bomb）
+HASH_LENGTH = 16
+WORKERS = int(os.getenv("AVATAR_WORKERS", "2"))
+PROCESS_TIMEOUT = 30
+MTIME_SLACK = 2  # 檔案系統的修改時間可能只精確到秒
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+class AvatarError(ValueError):
+    """圖片無法處理（格式不符、損毀、尺寸異常）"""
+
+
+def _render(data):
+    """在子程序執行：回傳 {檔名後綴: bytes}，例如 {"md.webp": b"..."}"""
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            if im.format not in ALLOWED_FORMATS:
+                raise AvatarError("檔案格式錯誤")
+            if im.width * im.height > MAX_PIXELS:
+                raise AvatarError("圖片尺寸過大")
+            largest = max(SIZES.values())
+            im.draft("RGB", (largest * 2, largest * 2))  # JPEG 直接以較低解析度解碼
+            im = ImageOps.exif_transpose(im)
+            has_alpha = im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+            im = im.convert("RGBA" if has_alpha else "RGB")
+    except AvatarError:
+        raise
+    except Exception as e:
+        raise AvatarError("無法讀取圖片") from e
+
+    outputs = {}
+    for size_name, size in SIZES.items():
+        square = ImageOps.fit(im, (size, size), Image.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            image = square
+            if fmt == "JPEG" and image.mode == "RGBA":
+                # JPEG 沒有透明度：鋪白底
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, **options)
+            outputs[f"{size_name}.{ext}"] = buffer.getvalue()
+    return outputs
+
+
+def _get_pool():
+    """每個程序各自建立程序池（gunicorn fork 出的 worker 不共用父程序的池）"""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def avatar_path(static_folder, digest, size_name, ext):
+    return os.path.join(static_folder, *AVATAR_DIR.split("/"), f"{digest}-{size_name}.{ext}")
+
+
+def avatar_variants(avatar_url):
+    """
+    由 avatar_url 推得各尺寸 / 格式的網址：{"sm": {"webp": url, "jpg": url}, ...}
+    舊格式（avatars/<user_id>.png）或空值回傳 None
+    """
+    marker = f"/{AVATAR_DIR}/"
+    if not avatar_url or marker not in avatar_url:
+        return None
+    prefix, name = avatar_url.rsplit("/", 1)
+    digest = name.split("-", 1)[0]
+    return {
+        size_name: {ext: f"{prefix}/{digest}-{size_name}.{ext}" for ext in FORMATS}
+        for size_name in SIZES
+    }
+
+
+def save_avatar(static_folder, data):
+    """
+    處理並寫入頭像，回傳相對於 static 的路徑（md 尺寸 WebP）
+    相同內容的圖片只處理一次（檔案都在時只更新修改時間）；格式不符或損毀時丟出 AvatarError
+    """
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise AvatarError("檔案過大")
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    relative = f"{AVATAR_DIR}/{digest}-{DEFAULT_SIZE}.{DEFAULT_FORMAT}"
+    try:
+        for size_name in SIZES:
+            for ext in FORMATS:
+                os.utime(avatar_path(static_folder, digest, size_name, ext))
+        return relative
+    except FileNotFoundError:
+        pass  # 尚未產生或已被刪除：重新處理
+
+    outputs = _get_pool().submit(_render, data).result(timeout=PROCESS_TIMEOUT)
+    os.makedirs(os.path.join(static_folder, *AVATAR_DIR.split("/")), exist_ok=True)
+    for suffix, content in outputs.items():
+        size_name, ext = suffix.split(".")
+        path = avatar_path(static_folder, digest, size_name, ext)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)  # 同時上傳相同圖片時不會讀到寫一半的檔案
+    return relative
+
+
+def remove_avatar(static_folder, avatar_url, checked_at):
+    """
+    刪除某個頭像的所有尺寸檔案（呼叫端須先確認沒有其他使用者共用）
+    checked_at: 確認無人使用前的 time.time()；之後被 save_avatar() 用過的檔案保留
+    """
+    variants = avatar_variants(avatar_url)
+    if not variants:
+        return
+    digest = avatar_url.rsplit("/", 1)[1].split("-", 1)[0]
+    cutoff = checked_at - MTIME_SLACK
+    for size_name in SIZES:
+        for ext in FORMATS:
+            path = avatar_path(static_folder, digest, size_name, ext)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
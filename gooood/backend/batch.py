@@ -0,0 +1,141 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, current_app, jsonify, request, session
+from flask.ctx import RequestContext
+from werkzeug.test import EnvironBuilder
+from config import shared_connection
+from json_provider import dumps_bytes
+
+batch_bp = Blueprint("batch_bp", __name__)
+
+# =========================================================
+# 批次 API：頁面載入時的多個 GET 合併成一次請求
+#   POST /api/batch  {"requests": ["/api/get-session", {"id": "n", "path": "/api/my_notifications"}]}
+#   回傳 {"success": true, "responses": [{"id": ..., "status": 200, "body": {...}}, ...]}（順序與請求相同）
+#   - 子請求在同一個 worker 內直接 dispatch 到原本的 view，沿用呼叫者的 session（權限檢查不變）
+#   - 子請求分成最多 CONCURRENCY 條通道同時執行；同一條通道內的子請求共用一條資料庫連線
+#     （MySQL 連線不能跨執行緒使用；BATCH_CONCURRENCY=1 時整個批次只用一條連線）
+#   - 子請求對 session 的修改不會寫回 cookie；只接受 GET
+#   - 子請求的 JSON 回應原封不動嵌入結果，不重新解析
+# =========================================================
+
+MAX_SUBREQUESTS = 10
+CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def _get_pool():
+    """每個程序各自建立執行緒池（gunicorn fork 出的 worker 不共用父程序的池）"""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="batch")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _parse(payload):
+    """回傳 [(順序, id, path)]；格式錯誤時丟出 ValueError"""
+    items = payload.get("requests") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ValueError("requests 必須是非空陣列")
+    if len(items) > MAX_SUBREQUESTS:
+        raise ValueError(f"一次最多 {MAX_SUBREQUESTS} 個請求")
+
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item_id, path = index, item
+        elif isinstance(item, dict) and isinstance(item.get("path"), str):
+            item_id, path = item.get("id", index), item["path"]
+            if item.get("method", "GET").upper() != "GET":
+                raise ValueError("只接受 GET 請求")
+        else:
+            raise ValueError(f"第 {index + 1} 個請求格式錯誤")
+        if not path.startswith("/") or path.startswith("//"):
+            raise ValueError(f"路徑錯誤：{path}")
+        if path.split("?", 1)[0].rstrip("/") == "/api/batch":
+            raise ValueError("不可巢狀呼叫 /api/batch")
+        parsed.append((index, item_id, path))
+    return parsed
+
+
+def _run_one(app, base, session_data, path):
+    """在目前執行緒 dispatch 一個子請求，回傳 (status, mimetype, body bytes)"""
+    route, _, query = path.partition("?")
+    environ = EnvironBuilder(
+        path=route,
+        query_string=query,
+        method="GET",
+        base_url=base["base_url"],
+        headers={"Cookie": base["cookie"]} if base["cookie"] else None,
+        environ_base={"REMOTE_ADDR": base["remote_addr"]},
+    ).get_environ()
+
+    ctx = RequestContext(app, environ, session=app.session_interface.session_class(session_data))
+    try:
+        with ctx:
+            response = app.full_dispatch_request()
+            try:
+                body = response.get_data()
+            finally:
+                response.close()
+        return response.status_code, response.mimetype, body
+    except Exception:
+        print("❌ 批次子請求失敗：", path, traceback.format_exc())
+        return 500, "application/json", dumps_bytes({"success": False, "message": "伺服器錯誤"})
+
+
+def _run_lane(app, base, session_data, lane):
+    """同一條通道內依序執行，共用一條資料庫連線；每個子請求結束後 rollback 未提交的交易"""
+    results = []
+    with shared_connection() as shared:
+        for index, item_id, path in lane:
+            results.append((index, _encode(item_id, *_run_one(app, base, dict(session_data), path))))
+            shared.reset()
+    return results
+
+
+def _encode(item_id, status, mimetype, body):
+    """組出單一結果的 JSON；JSON 回應直接嵌入，其他內容以字串表示"""
+    if mimetype != "application/json" or not body.strip():
+        body = dumps_bytes(body.decode("utf-8", "replace"))
+    return b'{"id":' + dumps_bytes(item_id) + b',"status":' + str(status).encode() + b',"body":' + body + b"}"
+
+
+@batch_bp.route("/api/batch", methods=["POST"])
+def batch():
+    try:
+        items = _parse(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    app = current_app._get_current_object()
+    base = {
+        "base_url": request.host_url,
+        "cookie": request.headers.get("Cookie"),
+        "remote_addr": request.remote_addr,
+    }
+    session_data = dict(session)
+
+    # 依序輪流分到各通道：[a, b, c, d] -> [a, d], [b], [c]
+    lanes = [items[i::CONCURRENCY] for i in range(min(CONCURRENCY, len(items)))]
+    if len(lanes) == 1:
+        lane_results = [_run_lane(app, base, session_data, lanes[0])]
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(_run_lane, app, base, session_data, lane) for lane in lanes]
+        lane_results = [f.result() for f in futures]
+
+    parts = [None] * len(items)
+    for results in lane_results:
+        for index, part in results:
+            parts[index] = part
+
+    body = b'{"success":true,"responses":[' + b",".join(parts) + b"]}"
+    return current_app.response_class(body, mimetype="application/json")
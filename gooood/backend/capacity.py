@@ -0,0 +1,173 @@
+import threading
+import time
+from config import get_db
+from catalog_cache import capacity_from_slots, read_version, bump_version
+
+# =========================================================
+# 職缺名額帳本
+#   job_capacity：每個職缺一列，capacity / reserved / placed / remaining 皆為整數
+#   job_slot_ledger：每次保留、釋出、分發的流水紀錄
+#   - 保留名額一律用條件式 UPDATE ... WHERE remaining > 0，並行時不會超賣
+#   - remaining 以版本號快取在記憶體，志願表單與分發查詢為 O(1)
+# =========================================================
+
+CAPACITY_KEY = "job_capacity"
+VERSION_CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_remaining = None
+_remaining_version = None
+_checked_at = 0.0
+
+
+def sync_capacity(cursor):
+    """
+    為尚未建立帳本的職缺補上 job_capacity（名額由 internship_jobs.slots 文字解析，規則同志願表單）
+    只處理缺少的職缺，平常幾乎不花時間
+    """
+    cursor.execute("""
+        SELECT ij.id, ij.slots
+        FROM internship_jobs ij
+        LEFT JOIN job_capacity jc ON jc.job_id = ij.id
+        WHERE jc.job_id IS NULL
+    """)
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    values = []
+    for row in rows:
+        job_id, slots = (row["id"], row["slots"]) if isinstance(row, dict) else row
+        capacity = capacity_from_slots(slots)
+        values.append((job_id, capacity, capacity))
+    cursor.executemany("""
+        INSERT IGNORE INTO job_capacity (job_id, capacity, remaining) VALUES (%s, %s, %s)
+    """, values)
+    bump_version(cursor, CAPACITY_KEY)
+    return len(values)
+
+
+def set_capacity(cursor, job_id, capacity):
+    """調整名額；不允許調到比已保留 + 已分發還少"""
+    cursor.execute("""
+        UPDATE job_capacity
+        SET capacity = %s, remaining = %s - reserved - placed
+        WHERE job_id = %s AND %s >= reserved + placed
+    """, (capacity, capacity, job_id, capacity))
+    if cursor.rowcount:
+        bump_version(cursor, CAPACITY_KEY)
+    return cursor.rowcount == 1
+
+
+def _log(cursor, job_id, student_id, action, quantity=1, run_id=None, created_by=None):
+    cursor.execute("""
+        INSERT INTO job_slot_ledger (job_id, student_id, action, quantity, run_id, created_by)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (job_id, student_id, action, quantity, run_id, created_by))
+
+
+def reserve_seat(cursor, job_id, student_id, created_by=None):
+    """
+    保留一個名額（由呼叫端 commit）
+    條件式 UPDATE 保證並行時不超賣；名額已滿回傳 False
+    """
+    cursor.execute("""
+        UPDATE job_capacity
+        SET reserved = reserved + 1, remaining = remaining - 1
+        WHERE job_id = %s AND remaining > 0
+    """, (job_id,))
+    if cursor.rowcount != 1:
+        return False
+    _log(cursor, job_id, student_id, "reserve", created_by=created_by)
+    bump_version(cursor, CAPACITY_KEY)
+    return True
+
+
+def release_seat(cursor, job_id, student_id, created_by=None):
+    """釋出一個保留名額（由呼叫端 commit）"""
+    cursor.execute("""
+        UPDATE job_capacity
+        SET reserved = reserved - 1, remaining = remaining + 1
+        WHERE job_id = %s AND reserved > 0
+    """, (job_id,))
+    if cursor.rowcount != 1:
+        return False
+    _log(cursor, job_id, student_id, "release", created_by=created_by)
+    bump_version(cursor, CAPACITY_KEY)
+    return True
+
+
+def record_placements(cursor, run_id, placements, created_by=None):
+    """
+    以一次分發結果取代目前的分發名額（由呼叫端 commit）
+    placements: [(student_id, job_id)]；任何職缺超過可用名額即丟出 ValueError
+    """
+    counts = {}
+    for _, job_id in placements:
+        counts[job_id] = counts.get(job_id, 0) + 1
+
+    cursor.execute("UPDATE job_capacity SET remaining = remaining + placed, placed = 0 WHERE placed > 0")
+    for job_id, count in counts.items():
+        cursor.execute("""
+            UPDATE job_capacity
+            SET placed = %s, remaining = remaining - %s
+            WHERE job_id = %s AND remaining >= %s
+        """, (count, count, job_id, count))
+        if cursor.rowcount != 1:
+            raise ValueError(f"職缺 {job_id} 名額不足")
+
+    cursor.executemany("""
+        INSERT INTO job_slot_ledger (job_id, student_id, action, quantity, run_id, created_by)
+        VALUES (%s, %s, 'place', 1, %s, %s)
+    """, [(job_id, student_id, run_id, created_by) for student_id, job_id in placements])
+    bump_version(cursor, CAPACITY_KEY)
+
+
+def available_for_matching(cursor):
+    """分發可用名額 {job_id: capacity - reserved}（前一次分發的名額會被取代，所以不扣除）"""
+    sync_capacity(cursor)
+    cursor.execute("SELECT job_id, capacity - reserved AS available FROM job_capacity")
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return {r["job_id"]: max(r["available"], 0) for r in rows}
+    return {job_id: max(available, 0) for job_id, available in rows}
+
+
+def get_remaining():
+    """
+    回傳 (版本號, {job_id: 剩餘名額})；每個 worker 最多每 VERSION_CHECK_INTERVAL 秒確認一次版本
+    """
+    global _remaining, _remaining_version, _checked_at
+
+    now = time.monotonic()
+    with _lock:
+        if _remaining is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+            return _remaining_version, _remaining
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if sync_capacity(cursor):
+            conn.commit()
+        version = read_version(cursor, CAPACITY_KEY)
+        with _lock:
+            current, current_version = _remaining, _remaining_version
+        if current is None or current_version != version:
+            cursor.execute("SELECT job_id, remaining FROM job_capacity")
+            current = dict(cursor.fetchall())
+        with _lock:
+            _remaining, _remaining_version, _checked_at = current, version, now
+        return version, current
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def delete_company_capacity(cursor, company_id):
+    """刪除公司前清掉其職缺的帳本（由呼叫端 commit）"""
+    cursor.execute("""
+        DELETE jc FROM job_capacity jc
+        JOIN internship_jobs ij ON ij.id = jc.job_id
+        WHERE ij.company_id = %s
+    """, (company_id,))
+    if cursor.rowcount:
+        bump_version(cursor, CAPACITY_KEY)
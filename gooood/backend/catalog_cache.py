@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+import traceback
+from config import get_db
+
+# =========================================================
+# 公司 / 職缺目錄快取
+#   - 已核准公司、各公司職缺、待審核公司清單常駐記憶體
+#   - 以資料庫 cache_versions 的版本號判斷是否過期（多個 worker 共用同一個版本號）
+#   - 每個 worker 最多每 VERSION_CHECK_INTERVAL 秒查一次版本號
+#   - 公司審核 / 退件 / 刪除 / 上傳後呼叫 bump_catalog_version()
+# =========================================================
+
+CATALOG_KEY = "company_catalog"
+VERSION_CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_catalog = None
+_checked_at = 0.0
+
+_SLOTS_RE = re.compile(r"\d+")
+DEFAULT_SLOTS = 1  # 名額欄位沒有數字時視為 1 名
+
+# 志願表單下拉選單所需的職缺欄位（精簡版）
+JOB_OPTION_FIELDS = ("id", "title", "department", "period", "work_time")
+
+
+def parse_slots(slots):
+    """把自由文字的名額（例如 "3"、"3人"、"2~3人"）轉成整數；無法判斷（例如 "若干"、空白）時回傳 None"""
+    if slots is None:
+        return None
+    if isinstance(slots, int):
+        return slots
+    m = _SLOTS_RE.search(str(slots))
+    return int(m.group()) if m else None
+
+
+def capacity_from_slots(slots):
+    """名額帳本、志願表單與分發共用的名額：解析不出數字時為 DEFAULT_SLOTS"""
+    capacity = parse_slots(slots)
+    return DEFAULT_SLOTS if capacity is None else capacity
+
+
+class Catalog:
+    """某一版本的目錄快照（只讀，請勿修改內容）"""
+
+    def __init__(self, version, approved, jobs_by_company, pending):
+        self.version = version
+        self.approved = approved                  # [{"id", "company_name"}]
+        self.jobs_by_company = jobs_by_company    # {company_id: [job dict]}
+        self.pending = pending                    # 審核頁的待審核公司清單（/api/get_pending_companies）
+        self.approved_ids = {c["id"] for c in approved}
+        # 預先整理每間公司的下拉選單資料，API 直接回傳，不必每次重組
+        self.job_options = {
+            company_id: [_job_option(job) for job in jobs]
+            for company_id, jobs in jobs_by_company.items()
+        }
+
+    def job_options_for(self, company_id):
+        return self.job_options.get(company_id, [])
+
+
+def _job_option(job):
+    option = {field: job[field] for field in JOB_OPTION_FIELDS}
+    option["slots"] = capacity_from_slots(job["slots"])
+    option["remaining"] = option["slots"]
+    return option
+
+
+def read_version(cursor, name):
+    """讀取 cache_versions 中某個快取的版本號（尚無紀錄時為 0）"""
+    cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+def bump_version(cursor, name):
+    """遞增某個快取的版本號（與異動同一個交易，由呼叫端 commit）"""
+    cursor.execute("""
+        INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, (name,))
+
+
+def bump_catalog_version(cursor):
+    """
+    目錄有異動時呼叫（與異動同一個交易，由呼叫端 commit）
+    本 worker 立即失效；其他 worker 在下一次版本檢查時重新載入
+    """
+    global _catalog
+    bump_version(cursor, CATALOG_KEY)
+    with _lock:
+        _catalog = None
+
+
+def invalidate_catalog():
+    """只清除本 worker 的快取（不更動版本號）"""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def _load_catalog(cursor, version):
+    cursor.execute("""
+        SELECT id, company_name
+        FROM internship_companies
+        WHERE status = 'approved'
+        ORDER BY company_name
+    """)
+    approved = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT ij.id, ij.company_id, ij.title, ij.description, ij.department,
+               ij.period, ij.work_time, ij.slots, ij.remark
+        FROM internship_jobs ij
+        JOIN internship_companies ic ON ij.company_id = ic.id
+        WHERE ic.status = 'approved'
+        ORDER BY ij.company_id, ij.id
+    """)
+    jobs_by_company = {}
+    for job in cursor.fetchall():
+        jobs_by_company.setdefault(job["company_id"], []).append(job)
+
+    cursor.execute("""
+        SELECT
+            ic.id,
+            u.name AS upload_teacher_name,
+            ic.company_name,
+            ic.contact_person AS contact_name,
+            ic.contact_email,
+            ic.submitted_at AS upload_time,
+            ic.status
+        FROM internship_companies ic
+        LEFT JOIN users u ON ic.uploaded_by_user_id = u.id
+        WHERE ic.status = 'pending'
+        ORDER BY ic.submitted_at DESC
+    """)
+    pending = cursor.fetchall()
+
+    return Catalog(version, approved, jobs_by_company, pending)
+
+
+def get_catalog():
+    """取得目前版本的目錄；版本號變動或尚未載入時重新讀取資料庫"""
+    global _catalog, _checked_at
+
+    now = time.monotonic()
+    with _lock:
+        catalog = _catalog
+        if catalog is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+            return catalog
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        version = read_version(cursor, CATALOG_KEY)
+        if catalog is None or catalog.version != version:
+            catalog = _load_catalog(cursor, version)
+        with _lock:
+            _catalog = catalog
+            _checked_at = now
+        return catalog
+    except Exception:
+        print("❌ 載入公司目錄錯誤：", traceback.format_exc())
+        raise
+    finally:
+        cursor.close()
+        conn.close()
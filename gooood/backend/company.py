@@ -2,9 +2,14 @@ from flask import Blueprint, request, jsonify, render_template, session, send_fi
 from config import get_db
 from datetime import datetime
 import traceback
-import pandas as pd
-import io
+import tempfile
 from werkzeug.utils import secure_filename
+from catalog_cache import bump_catalog_version, get_catalog
+from capacity import delete_company_capacity, set_capacity, reserve_seat, release_seat
+from company_import import ingest_companies, iter_upload_rows, import_company_table, DUPLICATE_MODES
+
+# 匯出檔超過此大小才寫到磁碟
+EXCEL_SPOOL_SIZE = 4 * 1024 * 1024
 
 company_bp = Blueprint("company_bp", __name__)
 
@@ -43,6 +48,7 @@ def upload_company_form():
                 contact_person, contact_title, contact_email, contact_phone,
                 uploaded_by_user_id, uploaded_by_role
             ))
+            bump_catalog_version(cursor)
             conn.commit()
             success_msg = f"✅ 公司「{company_name}」已成功上傳，狀態：待審核"
             return render_template('company/upload_company.html', success=success_msg)
@@ -62,99 +68,43 @@ def upload_company_form():
 # =========================================================
 @company_bp.route("/api/upload_company_bulk", methods=["POST"])
 def upload_company_bulk():
-    try:
-        data = request.get_json()
-        companies = data.get("companies", [])
-        if not companies or not isinstance(companies, list):
-            return jsonify({"success": False, "message": "缺少公司資料"}), 400
+    uploaded_by_user_id = session.get("user_id")
+    uploaded_by_role = session.get("role")
+    if not uploaded_by_user_id or not uploaded_by_role:
+        return jsonify({"success": False, "message": "請先登入"}), 401
 
-        uploaded_by_user_id = session.get("user_id")
-        uploaded_by_role = session.get("role")
-        if not uploaded_by_user_id or not uploaded_by_role:
-            return jsonify({"success": False, "message": "請先登入"}), 401
+    # 重複公司處理方式：skip（略過）/ update（合併到待審核公司）/ insert（照常新增）
+    duplicate_mode = request.args.get("duplicate_mode", "skip")
+    if duplicate_mode not in DUPLICATE_MODES:
+        return jsonify({"success": False, "message": "duplicate_mode 參數錯誤"}), 400
 
+    conn = None
+    try:
+        # 串流解析 body（JSON 陣列 / {"companies": [...]} / NDJSON），分批寫入、每批 commit
         conn = get_db()
-        cursor = conn.cursor()
-        inserted_company_count = 0
-        inserted_job_count = 0
-
-        for c in companies:
-            company_name = c.get("company_name") or c.get("公司名稱") or ""
-            if not company_name:
-                continue  # 跳過無公司名稱的資料
+        result = ingest_companies(conn, iter_upload_rows(request), uploaded_by_user_id, uploaded_by_role,
+                                  duplicate_mode=duplicate_mode)
 
-            # ✅ 對應前端欄位名稱
-            description = c.get("company_intro") or c.get("description") or c.get("公司簡介") or ""
-            location = c.get("company_address") or c.get("location") or c.get("公司地址") or ""
-            contact_person = c.get("contact_name") or c.get("contact_person") or c.get("聯絡人姓名") or ""
-            contact_title = c.get("contact_title") or c.get("聯絡人職稱") or ""
-            contact_email = c.get("contact_email") or c.get("聯絡信箱") or ""
-            contact_phone = c.get("contact_phone") or c.get("聯絡電話") or ""
+        if not result["companies"] and not result["errors"] and not result["duplicates"]:
+            return jsonify({"success": False, "message": "缺少公司資料"}), 400
 
-            # ✅ 插入公司資料
-            cursor.execute("""
-                INSERT INTO internship_companies
-                (company_name, description, location, contact_person, contact_title, contact_email, contact_phone,
-                 uploaded_by_user_id, uploaded_by_role, status, submitted_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', NOW())
-            """, (
-                company_name,
-                description,
-                location,
-                contact_person,
-                contact_title,
-                contact_email,
-                contact_phone,
-                uploaded_by_user_id,
-                uploaded_by_role
-            ))
-            company_id = cursor.lastrowid
-            inserted_company_count += 1
-
-            # ✅ 插入職缺資料（從欄位或 fallback 單筆職缺）
-            jobs = c.get("internship_jobs") or [{
-                "title": c.get("internship_unit") or "",
-                "description": c.get("internship_content") or "",
-                "department": c.get("department") or "", 
-                "period": c.get("internship_period") or "",
-                "work_time": c.get("internship_time") or "",
-                "slots": c.get("internship_quota") or "",
-                "remark": c.get("remark") or ""
-            }]
-
-            for job in jobs:
-                title = job.get("title") or ""
-                if not title:
-                    continue  # 沒有職缺名稱就跳過
-
-                description = job.get("description") or ""
-                department = job.get("department") or ""
-                location = job.get("location") or ""
-                period = job.get("period") or ""
-                work_time = job.get("work_time") or ""
-                slots = job.get("slots") or ""
-                remark = job.get("remark") or ""
-
-                cursor.execute("""
-                    INSERT INTO internship_jobs
-                    (company_id, title, description, department, period, work_time, slots, remark)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    company_id,
-                    title,
-                    description,
-                    department,
-                    period,
-                    work_time,
-                    slots,
-                    remark
-                ))
-                inserted_job_count += 1
+        message = f"✅ 成功上傳 {result['companies']} 間公司、{result['jobs']} 筆職缺資料"
+        merged = sum(1 for d in result["duplicates"] if d["action"] == "merged")
+        skipped = sum(1 for d in result["duplicates"] if d["action"] == "skipped")
+        if merged:
+            message += f"，合併 {merged} 間重複公司"
+        if skipped:
+            message += f"，略過 {skipped} 間重複公司"
+        if result["errors"]:
+            message += f"，{len(result['errors'])} 筆資料有誤未匯入"
 
-        conn.commit()
         return jsonify({
-            "success": True,
-            "message": f"✅ 成功上傳 {inserted_company_count} 間公司、{inserted_job_count} 筆職缺資料"
+            "success": result["companies"] > 0 or merged > 0,
+            "message": message,
+            "inserted_companies": result["companies"],
+            "inserted_jobs": result["jobs"],
+            "errors": result["errors"],
+            "duplicates": result["duplicates"]
         })
 
     except Exception:
@@ -162,11 +112,8 @@ def upload_company_bulk():
         return jsonify({"success": False, "message": "伺服器錯誤"}), 500
 
     finally:
-        try:
-            cursor.close()
+        if conn is not None:
             conn.close()
-        except:
-            pass
 
 # =========================================================
 # API - 審核公司
@@ -198,6 +145,7 @@ def api_approve_company():
             SET status = %s, reviewed_at = %s
             WHERE id = %s
         """, (status, datetime.now(), company_id))
+        bump_catalog_version(cursor)
         conn.commit()
 
         action_text = '核准' if status == 'approved' else '拒絕'
@@ -217,32 +165,9 @@ def api_approve_company():
 @company_bp.route("/api/get_pending_companies", methods=["GET"])
 def api_get_pending_companies():
     try:
-        conn = get_db()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT 
-                ic.id,
-                u.name AS upload_teacher_name,
-                ic.company_name,
-                ic.contact_person AS contact_name,
-                ic.contact_email,
-                ic.submitted_at AS upload_time,
-                ic.status
-            FROM internship_companies ic
-            LEFT JOIN users u ON ic.uploaded_by_user_id = u.id
-            LEFT JOIN classes_teacher ct ON ct.teacher_id = u.id
-            WHERE ic.status = 'pending'
-            ORDER BY ic.submitted_at DESC
-        """)
-
-        companies = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
         return jsonify({
             "success": True,
-            "companies": companies
+            "companies": get_catalog().pending
         })
 
     except Exception:
@@ -305,6 +230,7 @@ def reject_company():
                 reviewed_at=NOW()
             WHERE id=%s
         """, (reason, company_id))
+        bump_catalog_version(cursor)
         conn.commit()
         return jsonify(success=True, message="公司已退件，理由已保存")
     except Exception as e:
@@ -379,24 +305,11 @@ def api_get_company_detail():
         return jsonify({"success": False, "message": "伺服器錯誤"}), 500
    
 # =========================================================
-# 頁面 - 公司審核清單
+# 頁面 - 公司審核清單（清單由頁面呼叫 API 取得）
 # =========================================================
 @company_bp.route('/approve_list')
 def approve_company_list():
-    try:
-        conn = get_db()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM internship_companies WHERE status = 'pending'")
-        companies = cursor.fetchall()
-        return render_template('company/approve_company.html', companies=companies)
-
-    except Exception:
-        print("❌ 讀取公司清單錯誤：", traceback.format_exc())
-        return render_template('company/approve_company.html', error="伺服器錯誤")
-
-    finally:
-        cursor.close()
-        conn.close()
+    return render_template('company/approve_company.html')
 
 # =========================================================
 # API - 取得我上傳的公司（含職缺）
@@ -476,41 +389,53 @@ def api_upload_company_file():
     if not file:
         return jsonify({"success": False, "message": "沒有檔案"}), 400
 
-    try:
-        df = pd.read_excel(file)
-        required_cols = ["公司名稱", "公司描述", "公司地點", "聯絡人", "聯絡人職稱", "聯絡電子郵件", "聯絡電話"]
-        for col in required_cols:
-            if col not in df.columns:
-                return jsonify({"success": False, "message": f"缺少欄位：{col}"}), 400
+    # dry_run=1：只檢查並回傳預覽、錯誤列與重複公司，不寫入資料庫
+    dry_run = (request.values.get("dry_run") or "").lower() in ("1", "true", "yes")
+    duplicate_mode = request.values.get("duplicate_mode", "skip")
+    if duplicate_mode not in DUPLICATE_MODES:
+        return jsonify({"success": False, "message": "duplicate_mode 參數錯誤"}), 400
 
+    conn = None
+    try:
         conn = get_db()
-        cursor = conn.cursor()
-        insert_sql = """
-        INSERT INTO internship_companies
-       (company_name, description, location, contact_person, contact_title, contact_email, contact_phone,
-       uploaded_by_user_id, uploaded_by_role, status, submitted_at)
-       VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,'pending',NOW())
-       """
-
-        inserted_count = 0
-        for _, row in df.iterrows():
-         cursor.execute(insert_sql, (
-         row["公司名稱"], row["公司描述"], row["公司地點"],
-         row["聯絡人"], row["聯絡人職稱"], row["聯絡電子郵件"], row["聯絡電話"],
-         session["user_id"], session.get("role")
-        ))
-        inserted_count += 1
+        result = import_company_table(
+            conn, file.stream, file.filename or "", session["user_id"], session.get("role"),
+            dry_run=dry_run, duplicate_mode=duplicate_mode
+        )
 
-        conn.commit()
-        return jsonify({"success": True, "message": f"成功上傳 {inserted_count} 筆公司，等待主任審核"})
+        if dry_run:
+            message = f"可匯入 {result['companies']} 筆公司、{result['jobs']} 筆職缺"
+        else:
+            message = f"成功上傳 {result['companies']} 筆公司、{result['jobs']} 筆職缺，等待主任審核"
+        if result["duplicates"]:
+            message += f"，{len(result['duplicates'])} 筆與既有公司重複"
+        if result["skipped_jobs"]:
+            message += f"，略過 {len(result['skipped_jobs'])} 筆重複公司的職缺"
+        if result["errors"]:
+            message += f"（{len(result['errors'])} 列有誤）"
+
+        return jsonify({
+            "success": True,
+            "dry_run": dry_run,
+            "message": message,
+            "inserted_companies": result["companies"],
+            "inserted_jobs": result["jobs"],
+            "errors": result["errors"],
+            "duplicates": result["duplicates"],
+            "skipped_jobs": result["skipped_jobs"],
+            "preview": result["preview"]
+        })
+
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
     except Exception:
         print("❌ Excel 上傳錯誤：", traceback.format_exc())
         return jsonify({"success": False, "message": "伺服器錯誤"}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if conn is not None:
+            conn.close()
 
 # =========================================================
 # API - 下載公司詳細資料 (Excel, 中文欄位 + 含職缺)
@@ -574,27 +499,43 @@ def api_download_company_detail(company_id):
             "目前狀態": "核准" if company["status"] == "approved" else "拒絕" if company["status"] == "rejected" else "待審核"
         }
 
-        # ---- 建立 Excel ----
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # 公司基本資料
-            pd.DataFrame([company_data]).to_excel(writer, sheet_name='公司資料', index=False)
-
-            # 若有職缺，加入第二張工作表
-            if jobs:
-                job_df = pd.DataFrame(jobs)
-                # 改中文欄位名稱
-                job_df.rename(columns={
-                    "title": "實習單位名稱",
-                    "job_description": "工作內容",
-                    "department": "部門",
-                    "period": "實習期間",
-                    "work_time": "實習時間",
-                    "slots": "需求人數",
-                    "remark": "備註"
-                }, inplace=True)
-                job_df.to_excel(writer, sheet_name='實習職缺', index=False)
-
+        # ---- 建立 Excel（逐列寫入暫存檔，小檔留在記憶體、大檔自動落地）----
+        import xlsxwriter
+
+        output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_SIZE)
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+
+        def write_sheet(name, headers, rows):
+            sheet = workbook.add_worksheet(name)
+            sheet.write_row(0, 0, headers, header_format)
+            for r, values in enumerate(rows, 1):
+                for c, value in enumerate(values):
+                    if value is None or value == "":
+                        continue
+                    if isinstance(value, str):
+                        sheet.write_string(r, c, value)
+                    else:
+                        sheet.write(r, c, value)
+
+        # 公司基本資料
+        write_sheet('公司資料', list(company_data.keys()), [list(company_data.values())])
+
+        # 若有職缺，加入第二張工作表
+        if jobs:
+            job_columns = {
+                "title": "實習單位名稱",
+                "job_description": "工作內容",
+                "department": "部門",
+                "period": "實習期間",
+                "work_time": "實習時間",
+                "slots": "需求人數",
+                "remark": "備註"
+            }
+            write_sheet('實習職缺', list(job_columns.values()),
+                        ([job[key] for key in job_columns] for job in jobs))
+
+        workbook.close()
         output.seek(0)
         filename = f"{company['company_name']}_詳細資料.xlsx"
         return send_file(
@@ -651,12 +592,14 @@ def delete_company():
         db = get_db()
         cursor = db.cursor()
 
-        # 🔹 先刪除該公司底下的所有職缺
+        # 🔹 先刪除該公司職缺的名額帳本與所有職缺
+        delete_company_capacity(cursor, company_id)
         cursor.execute("DELETE FROM internship_jobs WHERE company_id = %s", (company_id,))
 
         # 🔹 再刪除公司資料
         cursor.execute("DELETE FROM internship_companies WHERE id = %s", (company_id,))
 
+        bump_catalog_version(cursor)
         db.commit()
         cursor.close()
         db.close()
@@ -675,11 +618,54 @@ def delete_company():
 # =========================================================
 @company_bp.route("/approve_company")
 def approve_company_page():
+    return render_template("company/approve_company.html")
+
+
+# =========================================================
+# API - 職缺名額帳本（調整名額 / 保留 / 釋出）
+#   POST /api/job_capacity/<job_id>          {"capacity": 3}
+#   POST /api/job_capacity/<job_id>/reserve  {"student_id": 12}
+#   POST /api/job_capacity/<job_id>/release  {"student_id": 12}
+# =========================================================
+@company_bp.route("/api/job_capacity/<int:job_id>", methods=["POST"])
+@company_bp.route("/api/job_capacity/<int:job_id>/<action>", methods=["POST"])
+def api_job_capacity(job_id, action="set"):
+    if session.get("role") not in ("director", "ta", "admin"):
+        return jsonify({"success": False, "message": "沒有權限"}), 403
+    if action not in ("set", "reserve", "release"):
+        return jsonify({"success": False, "message": "參數錯誤"}), 400
+
+    data = request.get_json(silent=True) or {}
     conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM internship_companies WHERE status='pending' ORDER BY submitted_at DESC")
-    companies = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    cursor = conn.cursor()
+    try:
+        if action == "set":
+            try:
+                capacity = int(data.get("capacity"))
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "message": "名額必須是整數"}), 400
+            if capacity < 0:
+                return jsonify({"success": False, "message": "名額不可小於 0"}), 400
+            ok = set_capacity(cursor, job_id, capacity)
+            fail_message = "名額不可少於已保留與已分發人數"
+        elif action == "reserve":
+            ok = reserve_seat(cursor, job_id, data.get("student_id"), session.get("user_id"))
+            fail_message = "名額已滿"
+        else:
+            ok = release_seat(cursor, job_id, data.get("student_id"), session.get("user_id"))
+            fail_message = "沒有可釋出的保留名額"
 
-    return render_template("company/approve_company.html", companies=companies)
+        if not ok:
+            conn.rollback()
+            return jsonify({"success": False, "message": fail_message}), 409
+        conn.commit()
+        return jsonify({"success": True, "message": "名額已更新"})
+
+    except Exception:
+        print("❌ 更新職缺名額錯誤：", traceback.format_exc())
+        conn.rollback()
+        return jsonify({"success": False, "message": "伺服器錯誤"}), 500
+
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,149 @@
+import re
+import unicodedata
+
+# =========================================================
+# 公司重複偵測索引
+#   - 名稱正規化：全半形、大小寫、空白與標點、公司型態字尾（股份有限公司 / 有限公司 / Co., Ltd. ...）
+#   - 聯絡方式：電話只留數字（+886 轉 0）、信箱轉小寫
+#   - 以 dict 做 blocking，比對一筆為 O(1)，整批上傳為 O(n)
+# =========================================================
+
+# 由長到短排列，避免「有限公司」先吃掉「股份有限公司」的一部分
+COMPANY_SUFFIXES = ("股份有限公司", "有限責任公司", "有限公司", "分公司", "公司")
+
+# 英文字尾必須與名稱有分隔（避免 Costco 被剝成 Cost）
+_LATIN_SUFFIX_RE = re.compile(
+    r"(?:[\s,\.]+(?:co|corp|corporation|company|inc|incorporated|ltd|limited|llc)\.?)+\s*$"
+)
+
+_PUNCT_RE = re.compile(r"[\s\.,，。、・·'\"()（）\[\]【】\-_/&＆]+")
+_DIGITS_RE = re.compile(r"\D+")
+
+
+def normalize_company_name(name):
+    """公司名稱正規化鍵；無法比對時回傳空字串"""
+    if not name:
+        return ""
+    key = unicodedata.normalize("NFKC", str(name)).lower().replace("臺", "台").strip()
+    key = _LATIN_SUFFIX_RE.sub("", key)
+    key = _PUNCT_RE.sub("", key)
+    # 字尾可能疊加（例如「有限公司分公司」），剝到不能再剝為止
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in COMPANY_SUFFIXES:
+            if key.endswith(suffix) and len(key) > len(suffix):
+                key = key[:-len(suffix)]
+                stripped = True
+                break
+    return key
+
+
+def normalize_phone(phone):
+    digits = _DIGITS_RE.sub("", str(phone or ""))
+    if digits.startswith("886"):
+        digits = "0" + digits[3:]
+    return digits if len(digits) >= 8 else ""
+
+
+def normalize_email(email):
+    email = str(email or "").strip().lower()
+    return email if "@" in email else ""
+
+
+def blocking_keys(company):
+    """回傳 [(比對依據, 鍵)]，依可信度排序"""
+    keys = []
+    name = normalize_company_name(company.get("company_name"))
+    if name:
+        keys.append(("name", name))
+    email = normalize_email(company.get("contact_email"))
+    if email:
+        keys.append(("email", email))
+    phone = normalize_phone(company.get("contact_phone"))
+    if phone:
+        keys.append(("phone", phone))
+    return keys
+
+
+class CompanyIndex:
+    """公司 blocking 索引：鍵 -> 公司 entry（{"id", "status", "company_name"}）"""
+
+    def __init__(self):
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, company, entry):
+        for kind, key in blocking_keys(company):
+            self._keys.setdefault((kind, key), entry)
+        return entry
+
+    def match(self, company):
+        """回傳 (entry, 比對依據)；沒有重複時回傳 (None, None)"""
+        for kind, key in blocking_keys(company):
+            entry = self._keys.get((kind, key))
+            if entry is not None:
+                return entry, kind
+        return None, None
+
+    @classmethod
+    def load(cls, conn):
+        """載入所有待審核 / 已核准公司（已退件的不算重複）"""
+        index = cls()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id, company_name, contact_email, contact_phone, status
+                FROM internship_companies
+                WHERE status IN ('pending', 'approved')
+                ORDER BY id
+            """)
+            for company_id, name, email, phone, status in cursor:
+                index.add(
+                    {"company_name": name, "contact_email": email, "contact_phone": phone},
+                    {"id": company_id, "status": status, "company_name": name}
+                )
+        finally:
+            cursor.close()
+        return index
+
+
+# =========================================================
+# 合併：把上傳資料補進既有的待審核公司
+# =========================================================
+MERGE_COLUMNS = ("description", "location", "contact_person", "contact_title", "contact_email", "contact_phone")
+
+
+def merge_company(cursor, company_id, company, jobs):
+    """
+    以上傳資料的非空欄位覆蓋既有公司；職缺依名稱去重後新增
+    只合併 pending 的公司，回傳新增的職缺數
+    """
+    assignments = ", ".join(f"{col} = COALESCE(NULLIF(%s, ''), {col})" for col in MERGE_COLUMNS)
+    cursor.execute(f"""
+        UPDATE internship_companies
+        SET {assignments}, submitted_at = NOW()
+        WHERE id = %s AND status = 'pending'
+    """, [company.get(col, "") for col in MERGE_COLUMNS] + [company_id])
+    if cursor.rowcount == 0:
+        return 0
+
+    cursor.execute("SELECT title FROM internship_jobs WHERE company_id = %s", (company_id,))
+    existing = {normalize_company_name(row[0]) for row in cursor.fetchall()}
+    new_jobs = []
+    for job in jobs:
+        key = normalize_company_name(job["title"])
+        if key not in existing:
+            existing.add(key)
+            new_jobs.append(job)
+
+    if new_jobs:
+        cursor.executemany("""
+            INSERT INTO internship_jobs
+            (company_id, title, description, department, period, work_time, slots, remark)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(company_id, j["title"], j["description"], j["department"], j["period"],
+               j["work_time"], j["slots"], j["remark"]) for j in new_jobs])
+    return len(new_jobs)
@@ -0,0 +1,701 @@
+import codecs
+import csv
+import io
+import json
+import re
+import traceback
+from datetime import date, datetime
+from catalog_cache import bump_catalog_version
+from company_dedup import CompanyIndex, merge_company
+
+# =========================================================
+# 公司 / 職缺批次匯入工具
+#   - 欄位別名只編譯一次（英文 / 中文欄位皆可）
+#   - 串流解析 NDJSON 或 JSON 陣列，不把整個 body 讀進記憶體
+#   - 分批多列 INSERT，每批 commit，失敗的批次逐筆重試並回報錯誤列
+#   - 每批在同一個交易內遞增公司目錄版本，中途失敗時已寫入的批次也不會留下過期的目錄快取
+# =========================================================
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+
+# 公司欄位：資料表欄位 -> 可接受的輸入欄位（依優先順序）
+COMPANY_FIELD_ALIASES = {
+    "company_name": ("company_name", "公司名稱"),
+    "description": ("company_intro", "description", "公司簡介", "公司描述"),
+    "location": ("company_address", "location", "公司地址", "公司地點"),
+    "contact_person": ("contact_name", "contact_person", "聯絡人姓名", "聯絡人"),
+    "contact_title": ("contact_title", "聯絡人職稱"),
+    "contact_email": ("contact_email", "聯絡信箱", "聯絡電子郵件"),
+    "contact_phone": ("contact_phone", "聯絡電話"),
+}
+
+# 職缺欄位：資料表欄位 -> 可接受的輸入欄位（依優先順序）
+JOB_FIELD_ALIASES = {
+    "title": ("title", "internship_unit", "實習單位名稱", "實習職位"),
+    "description": ("description", "internship_content", "工作內容", "實習內容"),
+    "department": ("department", "部門", "所屬部門", "實習地點"),
+    "period": ("period", "internship_period", "實習期間"),
+    "work_time": ("work_time", "internship_time", "實習時間", "實習時段"),
+    "slots": ("slots", "internship_quota", "需求人數", "實習人數"),
+    "remark": ("remark", "備註"),
+}
+
+# 公司與職缺平鋪在同一列時，description 是公司簡介，職缺內容只看這些欄位
+FLAT_JOB_DESCRIPTION_ALIASES = ("internship_content", "實習內容", "工作內容")
+
+COMPANY_COLUMNS = tuple(COMPANY_FIELD_ALIASES)
+JOB_COLUMNS = tuple(JOB_FIELD_ALIASES)
+
+# 各欄位長度上限（超過即視為錯誤列，避免整批被資料庫拒絕）
+FIELD_MAX_LENGTH = {
+    "company_name": 255,
+    "location": 255,
+    "contact_person": 100,
+    "contact_title": 100,
+    "contact_email": 255,
+    "contact_phone": 50,
+    "title": 255,
+    "department": 255,
+    "period": 255,
+    "work_time": 255,
+    "slots": 50,
+}
+
+
+def compile_aliases(aliases):
+    """把 {欄位: (別名...)} 編譯成 [(欄位, (別名...))]，供每列直接查表"""
+    return [(column, tuple(names)) for column, names in aliases.items()]
+
+
+_COMPANY_LOOKUP = compile_aliases(COMPANY_FIELD_ALIASES)
+_JOB_LOOKUP = compile_aliases(JOB_FIELD_ALIASES)
+
+
+def _clean(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:  # NaN
+        return ""
+    return str(value).strip()
+
+
+def resolve_fields(raw, lookup):
+    """依編譯好的別名表取出欄位值，第一個非空值勝出"""
+    record = {}
+    for column, names in lookup:
+        value = ""
+        for name in names:
+            value = _clean(raw.get(name))
+            if value:
+                break
+        record[column] = value
+    return record
+
+
+def _check_lengths(record):
+    for column, limit in FIELD_MAX_LENGTH.items():
+        value = record.get(column)
+        if value and len(value) > limit:
+            return f"欄位 {column} 超過 {limit} 字元"
+    return None
+
+
+def normalize_company(raw):
+    """
+    將一筆上傳資料轉成 (company, jobs, error)
+    company / jobs 皆為已對應資料表欄位的 dict；有錯誤時 company 為 None
+    """
+    if not isinstance(raw, dict):
+        return None, [], "資料格式錯誤"
+
+    company = resolve_fields(raw, _COMPANY_LOOKUP)
+    if not company["company_name"]:
+        return None, [], "缺少公司名稱"
+
+    raw_jobs = raw.get("internship_jobs") or [raw]  # 沒有職缺陣列就用平鋪欄位當單筆職缺
+    if not isinstance(raw_jobs, list):
+        return None, [], "internship_jobs 格式錯誤"
+
+    jobs = []
+    for raw_job in raw_jobs:
+        if not isinstance(raw_job, dict):
+            return None, [], "internship_jobs 格式錯誤"
+        job = resolve_fields(raw_job, _JOB_LOOKUP)
+        if raw_job is raw:
+            job["description"] = next(
+                (v for v in (_clean(raw.get(n)) for n in FLAT_JOB_DESCRIPTION_ALIASES) if v), "")
+        if job["title"]:
+            jobs.append(job)
+
+    error = _check_lengths(company)
+    for job in jobs:
+        error = error or _check_lengths(job)
+    if error:
+        return None, [], error
+
+    return company, jobs, None
+
+
+# =========================================================
+# 串流解析
+# =========================================================
+def iter_ndjson(stream):
+    """逐行讀取 NDJSON，回傳 (列號, 物件或 None, 錯誤訊息)"""
+    row_no = 0
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        row_no += 1
+        try:
+            yield row_no, json.loads(line), None
+        except ValueError:
+            yield row_no, None, "JSON 格式錯誤"
+
+
+def iter_json_array(stream, key="companies"):
+    """
+    增量解析 JSON 陣列：支援 [ {...}, ... ] 或 {"companies": [ {...}, ... ]}
+    每次只保留尚未解析完的片段，回傳 (列號, 物件, None)
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk)  # 多位元組字元可能被切在兩段之間
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    # 找到陣列開頭
+    skip_ws()
+    if pos >= len(buffer):
+        return
+    if buffer[pos] == "{":
+        marker = f'"{key}"'
+        while True:
+            idx = buffer.find(marker, pos)
+            if idx >= 0:
+                pos = idx + len(marker)
+                break
+            pos = max(pos, len(buffer) - len(marker))
+            if not fill():
+                raise ValueError(f"找不到 {key} 陣列")
+        while True:
+            idx = buffer.find("[", pos)
+            if idx >= 0:
+                pos = idx
+                break
+            pos = len(buffer)
+            if not fill():
+                raise ValueError(f"找不到 {key} 陣列")
+    if buffer[pos] != "[":
+        raise ValueError("資料必須是 JSON 陣列")
+    pos += 1
+
+    row_no = 0
+    while True:
+        skip_ws()
+        if pos >= len(buffer):
+            raise ValueError("JSON 陣列未結束")
+        if buffer[pos] == "]":
+            return
+        if buffer[pos] == ",":
+            pos += 1
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if eof or not fill():
+                raise ValueError("JSON 格式錯誤")
+            continue
+        # 物件恰好在 buffer 尾端時可能尚未完整（例如數字被截斷），多讀一段再確認
+        if end == len(buffer) and not eof and fill():
+            continue
+        pos = end
+        row_no += 1
+        yield row_no, obj, None
+
+
+def iter_upload_rows(req):
+    """依 Content-Type 選擇解析方式"""
+    mimetype = (req.mimetype or "").lower()
+    if mimetype in ("application/x-ndjson", "application/jsonlines", "application/x-jsonlines"):
+        return iter_ndjson(req.stream)
+    return iter_json_array(req.stream)
+
+
+# =========================================================
+# 分批寫入
+# =========================================================
+class IdMismatch(Exception):
+    """多列 INSERT 推算的公司 id 與實際寫入的不符（改為逐筆寫入）"""
+
+
+def _insert_companies(cursor, companies, user_id, role):
+    """
+    多列 INSERT 公司，回傳每筆公司的 id
+    id 以 LAST_INSERT_ID() 加上 auto_increment_increment 的間隔推算（Galera / 多主架構的間隔不為 1），
+    再於同一個交易內查回核對；不符時丟出 IdMismatch，由呼叫端改為逐筆寫入（單列 INSERT 的 lastrowid 一定正確）
+    """
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', NOW())"] * len(companies))
+    params = []
+    for c in companies:
+        params.extend(c[col] for col in COMPANY_COLUMNS)
+        params.extend((user_id, role))
+    cursor.execute(f"""
+        INSERT INTO internship_companies
+        (company_name, description, location, contact_person, contact_title, contact_email, contact_phone,
+         uploaded_by_user_id, uploaded_by_role, status, submitted_at)
+        VALUES {placeholders}
+    """, params)
+    first_id = cursor.lastrowid
+    if len(companies) == 1:
+        return [first_id]
+
+    cursor.execute("SELECT @@SESSION.auto_increment_increment")
+    step = cursor.fetchone()[0]
+    ids = [first_id + i * step for i in range(len(companies))]
+    cursor.execute(f"""
+        SELECT id, company_name FROM internship_companies
+        WHERE id IN ({", ".join(["%s"] * len(ids))}) AND uploaded_by_user_id = %s
+    """, ids + [user_id])
+    written = dict(cursor.fetchall())
+    if any(written.get(cid) != c["company_name"] for cid, c in zip(ids, companies)):
+        raise IdMismatch(f"推算的公司 id 與寫入結果不符（first_id={first_id}, step={step}）")
+    return ids
+
+
+def _insert_jobs(cursor, job_rows):
+    if not job_rows:
+        return 0
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(job_rows))
+    params = []
+    for company_id, job in job_rows:
+        params.append(company_id)
+        params.extend(job[col] for col in JOB_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO internship_jobs
+        (company_id, title, description, department, period, work_time, slots, remark)
+        VALUES {placeholders}
+    """, params)
+    return len(job_rows)
+
+
+def _write_chunk(conn, chunk, user_id, role):
+    """寫入一批 [(列號, company, jobs)]，回傳 (公司數, 職缺數, [公司 id])"""
+    cursor = conn.cursor()
+    try:
+        ids = _insert_companies(cursor, [c for _, c, _ in chunk], user_id, role)
+        job_rows = [(cid, job) for cid, (_, _, jobs) in zip(ids, chunk) for job in jobs]
+        job_count = _insert_jobs(cursor, job_rows)
+        bump_catalog_version(cursor)
+        conn.commit()
+        return len(ids), job_count, ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def flush_chunk(conn, chunk, user_id, role, errors):
+    """
+    寫入一批資料並 commit；整批失敗時改為逐筆寫入，找出真正出錯的列
+    回傳 (公司數, 職缺數, [(列號, 公司 id)])
+    """
+    if not chunk:
+        return 0, 0, []
+    try:
+        companies, jobs, ids = _write_chunk(conn, chunk, user_id, role)
+        return companies, jobs, [(item[0], cid) for item, cid in zip(chunk, ids)]
+    except Exception:
+        print("⚠️ 批次寫入失敗，改為逐筆寫入：", traceback.format_exc())
+
+    companies = jobs = 0
+    written = []
+    for item in chunk:
+        try:
+            c, j, ids = _write_chunk(conn, [item], user_id, role)
+            companies += c
+            jobs += j
+            written.append((item[0], ids[0]))
+        except Exception:
+            print(f"❌ 公司資料第 {item[0]} 列寫入失敗：", traceback.format_exc())
+            errors.append({"row": item[0], "message": "寫入失敗，請確認資料內容"})
+    return companies, jobs, written
+
+
+# =========================================================
+# 重複公司處理
+#   duplicate_mode:
+#     skip   - 名稱重複的公司略過（預設）
+#     update - 名稱重複且仍待審核的公司，合併欄位與職缺
+#     insert - 不做重複檢查，照常新增（仍回報疑似重複）
+#   只有聯絡電話 / 信箱相同的視為「疑似重複」，照常新增但會回報
+# =========================================================
+DUPLICATE_MODES = ("skip", "update", "insert")
+
+
+def dedup_chunk(conn, chunk, index, mode, duplicates, dry_run=False):
+    """
+    過濾一批 [(列號, company, jobs)]：回傳 (需新增的列, 暫存 entry 表, 合併新增的職缺數)
+    暫存 entry 於寫入後補上真正的公司 id，讓同一份檔案內的重複也能被偵測
+    """
+    fresh = []
+    pending_entries = {}
+    merged_jobs = 0
+    cursor = None
+
+    try:
+        for item in chunk:
+            row_no, company, jobs = item
+            entry, matched_on = index.match(company)
+            if entry is not None and entry.get("status") == "failed":
+                entry = None
+
+            if entry is None or mode == "insert" or matched_on != "name":
+                if entry is not None:
+                    duplicates.append(_duplicate_report(row_no, company, entry, matched_on, "inserted"))
+                fresh.append(item)
+                pending_entries[row_no] = index.add(
+                    company, {"id": None, "status": "pending", "company_name": company["company_name"]})
+                continue
+
+            action = "skipped"
+            if mode == "update" and entry["id"] is not None and entry["status"] == "pending":
+                action = "merged"
+                if not dry_run:
+                    cursor = cursor or conn.cursor()
+                    merged_jobs += merge_company(cursor, entry["id"], company, jobs)
+            duplicates.append(_duplicate_report(row_no, company, entry, matched_on, action))
+
+        if cursor is not None:
+            bump_catalog_version(cursor)
+            conn.commit()
+    except Exception:
+        if cursor is not None:
+            conn.rollback()
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+    return fresh, pending_entries, merged_jobs
+
+
+def _duplicate_report(row_no, company, entry, matched_on, action):
+    return {
+        "row": row_no,
+        "company_name": company["company_name"],
+        "matched_id": entry["id"],
+        "matched_name": entry["company_name"],
+        "matched_on": matched_on,
+        "action": action,
+    }
+
+
+def resolve_pending_entries(pending_entries, written):
+    """寫入完成後，補上暫存 entry 的公司 id；寫入失敗的標記為 failed"""
+    ids = dict(written)
+    for row_no, entry in pending_entries.items():
+        if row_no in ids:
+            entry["id"] = ids[row_no]
+        else:
+            entry["status"] = "failed"
+
+
+def ingest_companies(conn, rows, user_id, role, duplicate_mode="skip", chunk_size=CHUNK_SIZE):
+    """
+    rows: 可迭代的 (列號, 原始資料, 解析錯誤)
+    回傳 {"companies": n, "jobs": n, "errors": [{"row": n, "message": ...}], "duplicates": [...]}
+    """
+    errors = []
+    duplicates = []
+    chunk = []
+    total_companies = total_jobs = 0
+    index = CompanyIndex.load(conn)
+
+    def flush():
+        nonlocal total_companies, total_jobs
+        fresh, pending_entries, merged_jobs = dedup_chunk(conn, chunk, index, duplicate_mode, duplicates)
+        c, j, written = flush_chunk(conn, fresh, user_id, role, errors)
+        resolve_pending_entries(pending_entries, written)
+        total_companies += c
+        total_jobs += j + merged_jobs
+        chunk.clear()
+
+    row_no = 0
+    try:
+        for row_no, raw, parse_error in rows:
+            if parse_error:
+                errors.append({"row": row_no, "message": parse_error})
+                continue
+            company, jobs, error = normalize_company(raw)
+            if error:
+                errors.append({"row": row_no, "message": error})
+                continue
+            chunk.append((row_no, company, jobs))
+            if len(chunk) >= chunk_size:
+                flush()
+    except ValueError as e:
+        # 串流中途格式錯誤：已 commit 的批次保留，其餘停止處理
+        errors.append({"row": row_no + 1, "message": str(e)})
+    flush()
+
+    return {"companies": total_companies, "jobs": total_jobs, "errors": errors, "duplicates": duplicates}
+
+
+# =========================================================
+# Excel / CSV 匯入
+#   - .xlsx 以 openpyxl read-only 模式逐列串流；.csv 直接用 csv 模組
+#   - 每批資料以「欄」為單位統一轉型、驗證
+#   - dry_run 只回傳預覽與錯誤列，不寫入資料庫
+# =========================================================
+COMPANY_SHEET_NAMES = ("公司資料", "companies", "internship_companies")
+JOB_SHEET_NAMES = ("實習職缺", "職缺", "internship_jobs", "jobs")
+PREVIEW_LIMIT = 20
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_RE = re.compile(r"^[0-9+()#\-\s]+(?:(?:ext|分機)\s*[0-9]+)?$", re.IGNORECASE)
+
+
+def coerce_cell(value):
+    """試算表儲存格轉字串：空值 / NaN -> ""，整數型浮點數去掉 .0，日期轉文字"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    return str(value).strip()
+
+
+def _column_errors(values, check, message):
+    """對單一欄位的所有值做同一種檢查，回傳出錯的索引"""
+    return {i: message for i, v in enumerate(values) if v and not check(v)}
+
+
+def validate_columns(records, validators):
+    """
+    以欄為單位驗證一批 dict：validators = {欄位: (檢查函式, 錯誤訊息)}
+    回傳 {索引: 錯誤訊息}（每列只保留第一個錯誤）
+    """
+    errors = {}
+    for column, (check, message) in validators.items():
+        values = [r.get(column, "") for r in records]
+        for i, msg in _column_errors(values, check, message).items():
+            errors.setdefault(i, msg)
+    return errors
+
+
+COMPANY_VALIDATORS = {
+    "contact_email": (EMAIL_RE.match, "聯絡信箱格式錯誤"),
+    "contact_phone": (PHONE_RE.match, "聯絡電話格式錯誤"),
+}
+# 職缺沒有格式檢查：需求人數是自由文字（例如「3人」、「2~3人」、「若干」），只檢查長度（_check_lengths）；
+# 名額由 catalog_cache.capacity_from_slots 解析，解析不出數字時使用 DEFAULT_SLOTS
+
+
+def _iter_sheet(rows):
+    """把 (儲存格, ...) 列轉成 (Excel 列號, {標題: 值})；第一列為標題"""
+    header = None
+    for row_no, row in enumerate(rows, start=1):
+        if header is None:
+            header = [coerce_cell(h) for h in row]
+            continue
+        values = [coerce_cell(v) for v in row]
+        if not any(values):
+            continue
+        yield row_no, dict(zip(header, values))
+
+
+def open_table(file, filename):
+    """
+    開啟上傳的試算表，回傳 (公司列 iterator, 職缺列 iterator 或 None, 關閉函式)
+    .xlsx 以 read-only 模式開啟，僅在迭代時解析 XML
+    """
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+    if ext == "csv":
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        return _iter_sheet(csv.reader(text)), None, text.detach
+
+    if ext in ("xlsx", "xlsm"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(file, read_only=True, data_only=True)
+        sheets = {ws.title.strip().lower(): ws for ws in wb.worksheets}
+        company_ws = next((sheets[n] for n in COMPANY_SHEET_NAMES if n in sheets), wb.worksheets[0])
+        job_ws = next((sheets[n] for n in JOB_SHEET_NAMES if n in sheets), None)
+        if job_ws is company_ws:
+            job_ws = None
+        company_rows = _iter_sheet(company_ws.iter_rows(values_only=True))
+        job_rows = _iter_sheet(job_ws.iter_rows(values_only=True)) if job_ws is not None else None
+        return company_rows, job_rows, wb.close
+
+    raise ValueError("僅支援 .xlsx 或 .csv 檔案")
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _prepare_company_chunk(rows, errors):
+    """正規化 + 欄位驗證一批公司列，回傳可寫入的 [(列號, company, jobs)]"""
+    normalized = []
+    for row_no, raw in rows:
+        company, jobs, error = normalize_company(raw)
+        if error:
+            errors.append({"row": row_no, "sheet": "company", "message": error})
+        else:
+            normalized.append((row_no, company, jobs))
+
+    bad = validate_columns([c for _, c, _ in normalized], COMPANY_VALIDATORS)
+    ready = []
+    for i, item in enumerate(normalized):
+        message = bad.get(i)
+        if message:
+            errors.append({"row": item[0], "sheet": "company", "message": message})
+        else:
+            ready.append(item)
+    return ready
+
+
+def _prepare_job_chunk(rows, company_ids, default_company_id, errors, skipped, skipped_jobs):
+    """
+    正規化 + 欄位驗證一批職缺列，回傳 [(公司 id, job)]
+    skipped: 因重複而略過的公司名稱 -> 既有公司 id；這些公司的職缺一併略過，記入 skipped_jobs
+    """
+    ready = []
+    for row_no, raw in rows:
+        job = resolve_fields(raw, _JOB_LOOKUP)
+        name = _clean(raw.get("公司名稱") or raw.get("company_name"))
+        company_id = company_ids.get(name) if name else default_company_id
+        if company_id is None and not name and not company_ids and len(skipped) == 1:
+            name = next(iter(skipped))  # 檔案唯一的公司被略過
+        if not job["title"]:
+            errors.append({"row": row_no, "sheet": "job", "message": "缺少職缺名稱"})
+        elif company_id is None and name in skipped:
+            skipped_jobs.append({"row": row_no, "company_name": name, "title": job["title"],
+                                 "matched_id": skipped[name]})
+        elif company_id is None:
+            errors.append({"row": row_no, "sheet": "job", "message": f"找不到對應公司「{name}」"})
+        else:
+            error = _check_lengths(job)
+            if error:
+                errors.append({"row": row_no, "sheet": "job", "message": error})
+            else:
+                ready.append((company_id, job))
+    return ready
+
+
+def import_company_table(conn, file, filename, user_id, role, dry_run=False,
+                         duplicate_mode="skip", index=None, chunk_size=CHUNK_SIZE):
+    """
+    匯入公司試算表（含選用的實習職缺工作表）
+    回傳 {"companies", "jobs", "errors", "duplicates", "skipped_jobs", "preview"}；dry_run 時 companies / jobs 為可匯入的筆數
+    index: 既有公司的 CompanyIndex；未提供時由 conn 載入
+    """
+    errors = []
+    duplicates = []
+    preview = []
+    if index is None:
+        index = CompanyIndex.load(conn)
+    total_companies = total_jobs = 0
+    company_ids = {}  # 公司名稱 -> 新增的 id（職缺工作表以公司名稱對應）
+    skipped = {}      # 公司名稱 -> 重複的既有公司 id（略過模式下不新增公司，也不新增其職缺）
+    skipped_jobs = []
+
+    company_rows, job_rows, close = open_table(file, filename)
+    try:
+        for rows in _chunks(company_rows, chunk_size):
+            ready = _prepare_company_chunk(rows, errors)
+            seen = len(duplicates)
+            ready, pending_entries, merged_jobs = dedup_chunk(
+                conn, ready, index, duplicate_mode, duplicates, dry_run=dry_run)
+            total_jobs += merged_jobs
+            for dup in duplicates[seen:]:
+                if dup["action"] == "merged":  # 職缺工作表中屬於被合併公司的職缺，併入既有公司
+                    company_ids.setdefault(dup["company_name"], dup["matched_id"])
+                elif dup["action"] == "skipped":
+                    skipped.setdefault(dup["company_name"], dup["matched_id"])
+            if len(preview) < PREVIEW_LIMIT:
+                preview.extend({"row": row_no, **company, "internship_jobs": jobs}
+                               for row_no, company, jobs in ready[:PREVIEW_LIMIT - len(preview)])
+            if dry_run:
+                total_companies += len(ready)
+                total_jobs += sum(len(jobs) for _, _, jobs in ready)
+                for row_no, company, _ in ready:
+                    company_ids.setdefault(company["company_name"], row_no)
+                continue
+
+            c, j, written = flush_chunk(conn, ready, user_id, role, errors)
+            resolve_pending_entries(pending_entries, written)
+            total_companies += c
+            total_jobs += j
+            names = {item[0]: item[1]["company_name"] for item in ready}
+            for row_no, company_id in written:
+                company_ids.setdefault(names[row_no], company_id)
+
+        if job_rows is not None:
+            # 職缺工作表沒有公司名稱欄時，只在檔案僅有一間公司時直接對應
+            default_company_id = next(iter(company_ids.values())) if len(company_ids) == 1 else None
+            for rows in _chunks(job_rows, chunk_size):
+                ready = _prepare_job_chunk(rows, company_ids, default_company_id, errors,
+                                           skipped, skipped_jobs)
+                if dry_run:
+                    total_jobs += len(ready)
+                    continue
+                cursor = conn.cursor()
+                try:
+                    inserted = _insert_jobs(cursor, ready)
+                    if inserted:
+                        bump_catalog_version(cursor)
+                    conn.commit()
+                    total_jobs += inserted
+                except Exception:
+                    conn.rollback()
+                    print(f"❌ 職缺第 {rows[0][0]}～{rows[-1][0]} 列寫入失敗：", traceback.format_exc())
+                    errors.append({"row": rows[0][0], "sheet": "job",
+                                   "message": f"第 {rows[0][0]}～{rows[-1][0]} 列職缺寫入失敗"})
+                finally:
+                    cursor.close()
+    finally:
+        close()
+
+    errors.sort(key=lambda e: (e.get("sheet", ""), e["row"]))
+    return {"companies": total_companies, "jobs": total_jobs, "errors": errors,
+            "duplicates": duplicates, "skipped_jobs": skipped_jobs, "preview": preview}
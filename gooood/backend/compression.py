@@ -0,0 +1,123 @@
+import gzip
+import mimetypes
+import os
+import zlib
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # 沒有安裝 brotli 時只提供 gzip
+    brotli = None
+
+# =========================================================
+# 回應壓縮
+#   - JSON / HTML / CSS / JS 超過 MIN_SIZE 時依 Accept-Encoding 以 br 或 gzip 壓縮
+#   - 串流回應（stream_template）邊產生邊壓縮，每累積 STREAM_FLUSH_SIZE 送出一次
+#   - 靜態檔若有預先壓縮的 .br / .gz（precompress_static.py 產生）直接送出，不在請求時壓縮
+#   - 壓縮後的 ETag 改為 weak，If-None-Match 仍可比對；一律加上 Vary: Accept-Encoding
+# =========================================================
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+STREAM_FLUSH_SIZE = 8 * 1024
+
+COMPRESSIBLE_TYPES = {
+    "application/json", "text/html", "text/plain", "text/css",
+    "application/javascript", "text/javascript", "image/svg+xml",
+}
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+PRECOMPRESSED_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+
+def negotiate():
+    """依 Accept-Encoding 選擇 br / gzip；都不接受時回傳 None"""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def _compress_stream(chunks, encoding):
+    """串流壓縮；原本的產生器結束或連線中斷時一併關閉"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, sync, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31：gzip 格式
+        process, finish = compressor.compress, compressor.flush
+        sync = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    try:
+        pending = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = process(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_SIZE:
+                out += sync()
+                pending = 0
+            if out:
+                yield out
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """註冊回應壓縮，並讓 static 路由優先送出預先壓縮的檔案"""
+    app.after_request(compress_response)
+    static_view = app.view_functions["static"]
+
+    def static(filename):
+        encoding = negotiate()
+        if encoding:
+            compressed = filename + PRECOMPRESSED_SUFFIX[encoding]
+            path = safe_join(app.static_folder, compressed)
+            if path and os.path.isfile(path):
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(app.static_folder, compressed, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                response.vary.add("Accept-Encoding")
+                return response
+        response = static_view(filename=filename)
+        if response.mimetype in COMPRESSIBLE_TYPES:
+            response.vary.add("Accept-Encoding")
+        return response
+
+    app.view_functions["static"] = static
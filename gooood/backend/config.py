@@ -1,9 +1,68 @@
+import threading
+from contextlib import contextmanager
 import mysql.connector
 
-def get_db():
+_local = threading.local()
+
+
+def _connect():
     return mysql.connector.connect(
         host="localhost",
         user="root",
         password="",
         database="user"
     )
+
+
+def get_db():
+    shared = getattr(_local, "shared", None)
+    if shared is not None:
+        return shared.connection()
+    return _connect()
+
+
+# -------------------------
+# 共用連線（批次 API）：同一執行緒在 shared_connection() 範圍內的 get_db() 都拿到同一條連線
+#   - handler 照常呼叫 conn.close()，實際上不會關閉；範圍結束時才關閉
+#   - 每個子請求結束後呼叫 reset()，rollback 未提交的交易，下一個子請求看到最新資料
+# -------------------------
+class SharedConnection:
+    def __init__(self):
+        self._conn = None
+
+    def connection(self):
+        if self._conn is None:
+            self._conn = _connect()
+        return self
+
+    def reset(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.rollback()
+        except Exception:
+            # 例如上一個 handler 留下未讀完的結果：捨棄這條連線，下一次 get_db() 重新連線
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def close(self):
+        pass  # 由 shared_connection() 結束時關閉
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@contextmanager
+def shared_connection():
+    """範圍內第一次 get_db() 才建立連線"""
+    shared = SharedConnection()
+    _local.shared = shared
+    try:
+        yield shared
+    finally:
+        _local.shared = None
+        if shared._conn is not None:
+            shared._conn.close()
@@ -0,0 +1,90 @@
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+# =========================================================
+# 以範本產生 Word（docx）
+#   - 範本是一份一般的 docx，內文以 {{名稱}} 標記要替換的文字
+#   - 表格列以一整列 <w:tr> 當樣板，每列只做字串替換，不經過 python-docx 的物件模型
+#   - document.xml 直接串流寫進 zip，其餘檔案（樣式、設定）原封不動複製
+# =========================================================
+
+DOCUMENT_PART = "word/document.xml"
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+def text_xml(value):
+    """儲存格文字 → <w:t> 內容；換行轉成 <w:br/>"""
+    if value is None or value == "":
+        return ""
+    lines = [escape(line) for line in str(value).split("\n")]
+    return '</w:t><w:br/><w:t xml:space="preserve">'.join(lines)
+
+
+def fill(xml, values):
+    """把 <w:t>{{名稱}}</w:t> 換成對應文字"""
+    for name, value in values.items():
+        xml = xml.replace(f"<w:t>{{{{{name}}}}}</w:t>", f'<w:t xml:space="preserve">{text_xml(value)}</w:t>')
+    return xml
+
+
+def row_formatter(row_xml, names):
+    """
+    把列樣板轉成 format 字串，之後每列只做一次 str.format
+    回傳 f(values)：values 依 names 順序
+    """
+    xml = row_xml
+    for i, name in enumerate(names):
+        xml = xml.replace(f"<w:t>{{{{{name}}}}}</w:t>", f'<w:t xml:space="preserve">\x00{i}\x00</w:t>')
+    xml = xml.replace("{", "{{").replace("}", "}}")
+    for i in range(len(names)):
+        xml = xml.replace(f"\x00{i}\x00", f"{{{i}}}")
+    return lambda values: xml.format(*[text_xml(v) for v in values])
+
+
+class DocxTemplate:
+    """
+    docx 範本
+      head / body / tail - document.xml 拆成 <w:body> 之前、內文、<w:sectPr> 之後
+    """
+
+    def __init__(self, docx_bytes):
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+            self.parts = [(info, zf.read(info)) for info in zf.infolist() if info.filename != DOCUMENT_PART]
+            document = zf.read(DOCUMENT_PART).decode("utf-8")
+
+        body_start = document.index("<w:body>") + len("<w:body>")
+        sect_start = document.rindex("<w:sectPr")
+        self.head = document[:body_start]
+        self.body = document[body_start:sect_start]
+        self.tail = document[sect_start:]
+
+    @staticmethod
+    def split_row(xml, marker):
+        """
+        以含有 {{marker}} 的表格列切開 xml
+        回傳 (列之前, 列樣板, 列之後)
+        """
+        at = xml.index(f"{{{{{marker}}}}}")
+        start = max(xml.rfind("<w:tr>", 0, at), xml.rfind("<w:tr ", 0, at))
+        end = xml.index("</w:tr>", at) + len("</w:tr>")
+        return xml[:start], xml[start:end], xml[end:]
+
+    @staticmethod
+    def split_table(xml, marker):
+        """以含有 {{marker}} 的整張表格切開 xml；回傳 (表格之前, 表格, 表格之後)"""
+        at = xml.index(f"{{{{{marker}}}}}")
+        start = xml.rindex("<w:tbl>", 0, at)
+        end = xml.index("</w:tbl>", at) + len("</w:tbl>")
+        return xml[:start], xml[start:end], xml[end:]
+
+    def write(self, out, chunks):
+        """把 head + chunks（內文片段）+ tail 串流寫成 docx"""
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            for info, data in self.parts:
+                zf.writestr(info, data)
+            with zf.open(DOCUMENT_PART, "w") as document:
+                document.write(self.head.encode("utf-8"))
+                for chunk in chunks:
+                    document.write(chunk.encode("utf-8"))
+                document.write(self.tail.encode("utf-8"))
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+from app import FRONTEND_DIR
+from static_assets import ASSETS_DIR, MANIFEST_NAME
+
+# =========================================================
+# 部署步驟：產生帶內容雜湊的靜態檔與 manifest.json
+#   - images/logo.png → assets/images/logo.<雜湊>.png（內容不變則檔名不變）
+#   - 舊版本的雜湊檔保留不刪，滾動部署時仍在服務的舊 worker 所產生的網址不會失效
+#   - 使用者上傳的 avatars/ 內容會變動，不做雜湊
+#   - 用法：cd backend && python fingerprint_static.py && python precompress_static.py
+# =========================================================
+
+STATIC_DIR = os.path.join(FRONTEND_DIR, "static")
+SKIP_DIRS = {ASSETS_DIR, "avatars"}
+HASH_LENGTH = 10
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def build(static_dir):
+    """回傳 manifest {原始路徑: 帶雜湊的路徑}（路徑以 / 分隔，相對於 static_dir）"""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            if name == MANIFEST_NAME or name.endswith((".gz", ".br")):
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            stem, ext = os.path.splitext(relative)
+            hashed = f"{ASSETS_DIR}/{stem}.{_file_hash(source)}{ext}"
+
+            target = os.path.join(static_dir, *hashed.split("/"))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+            manifest[relative] = hashed
+
+    # manifest 最後才換上，worker 讀到時對應的檔案都已存在
+    path = os.path.join(static_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+if __name__ == "__main__":
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    print(f"✅ 已產生 {len(build(static_dir))} 個帶雜湊的靜態檔 → {static_dir}/{ASSETS_DIR}")
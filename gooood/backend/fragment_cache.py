@@ -0,0 +1,38 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+
+# =========================================================
+# 頁面片段快取
+#   - 已渲染的 HTML 片段（例如一位學生的志願區塊）常駐記憶體，每個 worker 各一份
+#   - 鍵須包含片段內容的版本（學生志願版本、公司目錄版本、快照 id…），
+#     資料變動時自然產生新鍵，不需主動清除；舊片段依 LRU 淘汰
+# =========================================================
+
+MAX_ENTRIES = 5000
+
+_lock = threading.Lock()
+_fragments = OrderedDict()
+
+
+def render_fragment(template_name, key, **context):
+    """以 (template_name, key) 為鍵取出或渲染片段；回傳 Markup，可直接放進模板"""
+    cache_key = (template_name, key)
+    with _lock:
+        html = _fragments.get(cache_key)
+        if html is not None:
+            _fragments.move_to_end(cache_key)
+            return html
+
+    html = Markup(current_app.jinja_env.get_template(template_name).render(**context))
+    with _lock:
+        _fragments[cache_key] = html
+        while len(_fragments) > MAX_ENTRIES:
+            _fragments.popitem(last=False)
+    return html
+
+
+def clear():
+    with _lock:
+        _fragments.clear()
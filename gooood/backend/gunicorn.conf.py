@@ -0,0 +1,23 @@
+import gc
+import os
+
+# =========================================================
+# gunicorn 設定：gunicorn -c gunicorn.conf.py（在 backend 目錄執行）
+# =========================================================
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+preload_app = True  # 在主程序載入 app，worker 以 fork 共用記憶體
+timeout = 120       # 全校志願匯出可能需要較長時間
+
+
+def pre_fork(server, worker):
+    # 主程序在 fork 前產生的物件（gunicorn 本身）也一併凍結
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # worker 異常結束後由 gunicorn 重新啟動時，寫入它留下的志願日誌檔
+    from preference_buffer import recover_journals
+    recover_journals()
@@ -0,0 +1,69 @@
+import os
+import re
+import subprocess
+import sys
+
+# =========================================================
+# 啟動時間檢查
+#   - 以 python -X importtime 執行 create_app()，量測 worker 啟動時 import 的總時間
+#   - 超過 IMPORT_BUDGET_MS（預設 400ms）或啟動時就載入了匯出 / 分發用的大型套件時，回傳非 0
+#   - 用法：cd backend && python import_budget.py（可放進部署前的檢查）
+# =========================================================
+
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "400"))
+RUNS = 3
+
+# 只有匯出、匯入、分發請求會用到，不應在啟動時載入
+LAZY_MODULES = ("openpyxl", "xlsxwriter", "docx", "reportlab", "pypdf", "numpy", "scipy", "pandas")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _importtime(code):
+    """回傳 ({模組: 累計微秒}, 最外層 import 的累計微秒總和)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+            if len(match.group(3)) == 1:
+                total += int(match.group(2))
+    return modules, total
+
+
+def measure():
+    """建立 app（匯入所有 Blueprint）的 import 時間，扣除直譯器本身啟動的部分"""
+    _, baseline = _importtime("pass")
+    modules, total = _importtime("from app import create_app; create_app()")
+    return modules, total - baseline
+
+
+def main():
+    runs = [measure() for _ in range(RUNS)]
+    modules, total = min(runs, key=lambda r: r[1])  # 取最快一次，降低機器負載的干擾
+    total_ms = total / 1000
+
+    heavy = sorted(name for name in modules if name.split(".")[0] in LAZY_MODULES)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]
+
+    print(f"create_app() import：{total_ms:.0f}ms（上限 {IMPORT_BUDGET_MS}ms）")
+    for name, us in slowest:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+
+    failed = False
+    if total_ms > IMPORT_BUDGET_MS:
+        print(f"❌ 啟動 import 時間超過上限 {IMPORT_BUDGET_MS}ms")
+        failed = True
+    if heavy:
+        print("❌ 啟動時載入了應延後載入的套件：", ", ".join(sorted({n.split(".")[0] for n in heavy})))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
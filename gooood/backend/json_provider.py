@@ -0,0 +1,52 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import orjson
+from flask.json.provider import JSONProvider
+
+# =========================================================
+# JSON 序列化（jsonify / request.get_json 共用）
+#   - 以 orjson 一次序列化整個回應，取代標準 json encoder
+#   - datetime 一律輸出成 "%Y-%m-%d %H:%M:%S"、date 輸出成 "%Y-%m-%d"，
+#     handler 不必再逐列 strftime，直接 jsonify 資料庫查詢結果即可
+#   - Decimal 輸出成字串（與 Flask 預設相同，避免金額失去精度）
+# =========================================================
+
+# 日期交給 _default 依專案格式輸出；允許整數 dict key（例如 {company_id: [...]}）
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    # 資料庫取回的 datetime 不帶時區，isoformat(" ", "seconds") 即 "%Y-%m-%d %H:%M:%S"，比 strftime 快數倍
+    if isinstance(obj, datetime):
+        return obj.isoformat(" ", "seconds")
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, time):
+        return obj.isoformat("seconds")
+    if isinstance(obj, timedelta):  # MySQL TIME 欄位
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+class OrjsonProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,266 @@
+import numpy as np
+from capacity import available_for_matching, record_placements
+
+# =========================================================
+# 實習分發引擎
+#   - 讀取所有學生的 student_preferences 與名額帳本（job_capacity）的可用名額
+#   - deferred_acceptance：學生提出的延遲接受演算法（穩定配對）
+#   - min_cost：以 SciPy linear_sum_assignment 求志願序總和最小的分發
+#   - 職缺對學生的優先順序由 tie_break 規則決定；lottery 以 seed 固定，可重現
+#   - 結果寫入 placement_runs / placement_results，final_results 頁面讀取最新一次
+# =========================================================
+
+ALGORITHMS = ("deferred_acceptance", "min_cost")
+TIE_BREAKS = ("lottery", "submitted_at", "student_number")
+
+
+# =========================================================
+# 讀取資料 → 陣列
+# =========================================================
+def load_problem(cursor):
+    """
+    回傳 dict：
+      students  - [{"id", "username", "submitted_at"}]（索引即學生編號）
+      job_ids   - np.array 職缺 id
+      company_of_job - np.array 對應公司 id
+      capacity  - np.array 名額
+      pref      - S x K 的職缺索引（-1 表示空）
+      pref_order - S x K 原始志願序號
+    """
+    available = available_for_matching(cursor)
+    cursor.execute("""
+        SELECT ij.id, ij.company_id
+        FROM internship_jobs ij
+        JOIN internship_companies ic ON ij.company_id = ic.id
+        WHERE ic.status = 'approved'
+        ORDER BY ij.company_id, ij.id
+    """)
+    jobs = cursor.fetchall()
+    job_index = {job["id"]: i for i, job in enumerate(jobs)}
+    jobs_of_company = {}
+    for i, job in enumerate(jobs):
+        jobs_of_company.setdefault(job["company_id"], []).append(i)
+
+    cursor.execute("""
+        SELECT sp.student_id, sp.preference_order, sp.company_id, sp.job_id, sp.submitted_at, u.username
+        FROM student_preferences sp
+        JOIN users u ON u.id = sp.student_id AND u.role = 'student'
+        ORDER BY sp.student_id, sp.preference_order
+    """)
+    rows = cursor.fetchall()
+
+    students = []
+    student_index = {}
+    choices = []  # 每位學生的 [(職缺索引, 志願序)]
+    for row in rows:
+        sid = row["student_id"]
+        if sid not in student_index:
+            student_index[sid] = len(students)
+            students.append({"id": sid, "username": row["username"] or "", "submitted_at": row["submitted_at"]})
+            choices.append([])
+        s = student_index[sid]
+        if row["submitted_at"] and (students[s]["submitted_at"] is None or row["submitted_at"] > students[s]["submitted_at"]):
+            students[s]["submitted_at"] = row["submitted_at"]  # 以最後一次送出時間為準
+
+        # 有指定職缺就用該職缺；只填公司時，展開為該公司的所有職缺
+        if row["job_id"] in job_index:
+            targets = [job_index[row["job_id"]]]
+        else:
+            targets = jobs_of_company.get(row["company_id"], [])
+        seen = {j for j, _ in choices[s]}
+        choices[s].extend((j, row["preference_order"]) for j in targets if j not in seen)
+
+    K = max((len(c) for c in choices), default=0)
+    pref = np.full((len(students), K), -1, dtype=np.int64)
+    pref_order = np.zeros((len(students), K), dtype=np.int64)
+    for s, items in enumerate(choices):
+        if items:
+            pref[s, :len(items)] = [j for j, _ in items]
+            pref_order[s, :len(items)] = [o for _, o in items]
+
+    capacity = np.array([available.get(job["id"], 0) for job in jobs], dtype=np.int64)
+    return {
+        "students": students,
+        "job_ids": np.array([job["id"] for job in jobs], dtype=np.int64),
+        "company_of_job": np.array([job["company_id"] for job in jobs], dtype=np.int64),
+        "capacity": capacity,
+        "pref": pref,
+        "pref_order": pref_order,
+    }
+
+
+def priority_ranks(students, tie_break, seed):
+    """回傳每位學生的優先名次（0 最優先）；同名次一律以 seed 抽籤決定"""
+    n = len(students)
+    lottery = np.random.default_rng(seed).permutation(n)
+    if tie_break == "submitted_at":
+        ts = np.array([s["submitted_at"].timestamp() if s["submitted_at"] else np.inf for s in students])
+        order = np.lexsort((lottery, ts))
+    elif tie_break == "student_number":
+        numbers = np.array([s["username"] for s in students], dtype=object)
+        number_rank = np.argsort(np.argsort(numbers, kind="stable"), kind="stable")
+        order = np.lexsort((lottery, number_rank))
+    else:
+        order = np.argsort(lottery)
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.arange(n)
+    return ranks
+
+
+# =========================================================
+# 演算法
+# =========================================================
+def deferred_acceptance(pref, capacity, priority):
+    """
+    學生提出的延遲接受演算法（所有職缺共用同一優先順序）
+    回傳 match：每位學生分到的職缺索引，未分發為 -1
+    每一輪所有未配對學生同時向下一個志願提出，職缺以向量運算保留名次最前的 capacity 人
+    """
+    S, K = pref.shape
+    match = np.full(S, -1, dtype=np.int64)
+    next_choice = np.zeros(S, dtype=np.int64)
+
+    while True:
+        proposers = np.flatnonzero((match == -1) & (next_choice < K))
+        if proposers.size == 0:
+            break
+        targets = pref[proposers, next_choice[proposers]]
+        next_choice[proposers] += 1
+        valid = targets >= 0
+        next_choice[proposers[~valid]] = K  # 志願已用完
+        proposers, targets = proposers[valid], targets[valid]
+        if proposers.size == 0:
+            continue
+
+        held = np.flatnonzero(match >= 0)
+        cand_s = np.concatenate([held, proposers])
+        cand_j = np.concatenate([match[held], targets])
+
+        # 依 (職缺, 優先名次) 排序，計算每人在該職缺的名次
+        order = np.lexsort((priority[cand_s], cand_j))
+        cand_s, cand_j = cand_s[order], cand_j[order]
+        group_start = np.r_[0, np.flatnonzero(np.diff(cand_j)) + 1]
+        group_sizes = np.diff(np.r_[group_start, cand_j.size])
+        rank_in_job = np.arange(cand_j.size) - np.repeat(group_start, group_sizes)
+
+        accepted = rank_in_job < capacity[cand_j]
+        match[cand_s] = np.where(accepted, cand_j, -1)
+
+    return match
+
+
+def min_cost_assignment(pref, capacity, priority):
+    """
+    以志願序總和最小為目標的分發（SciPy linear_sum_assignment）
+    名次較前的學生權重稍高，志願序相同時優先讓他拿到較前面的志願
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    S, K = pref.shape
+    match = np.full(S, -1, dtype=np.int64)
+    listed = np.unique(pref[pref >= 0])
+    if S == 0 or listed.size == 0:
+        return match
+
+    # 只展開有人填的職缺，每個名額一欄；另外每位學生一個「未分發」欄
+    slot_job = np.repeat(listed, capacity[listed])
+    if slot_job.size == 0:
+        return match
+    weight = 1.0 + 1e-3 * (S - priority) / S
+    unassigned_cost = (K + 1) * weight
+
+    cost = np.full((S, slot_job.size + S), np.inf)
+    slot_of_job = {j: np.flatnonzero(slot_job == j) for j in listed}
+    for k in range(K):
+        rows = np.flatnonzero(pref[:, k] >= 0)
+        for j in np.unique(pref[rows, k]):
+            who = rows[pref[rows, k] == j]
+            cost[np.ix_(who, slot_of_job[j])] = ((k + 1) * weight[who])[:, None]
+    cost[:, slot_job.size:] = np.where(np.eye(S, dtype=bool), unassigned_cost[:, None], np.inf)
+
+    rows, cols = linear_sum_assignment(cost)
+    placed = cols < slot_job.size
+    match[rows[placed]] = slot_job[cols[placed]]
+    return match
+
+
+def run_matching(problem, algorithm="deferred_acceptance", tie_break="lottery", seed=0):
+    """回傳 [(student_id, company_id, job_id, preference_order)]（未分發者 company/job/order 為 None）"""
+    pref = problem["pref"]
+    priority = priority_ranks(problem["students"], tie_break, seed)
+    if algorithm == "min_cost":
+        match = min_cost_assignment(pref, problem["capacity"], priority)
+    else:
+        match = deferred_acceptance(pref, problem["capacity"], priority)
+
+    results = []
+    for s, student in enumerate(problem["students"]):
+        j = match[s]
+        if j < 0:
+            results.append((student["id"], None, None, None))
+            continue
+        k = int(np.flatnonzero(pref[s] == j)[0])
+        results.append((
+            student["id"],
+            int(problem["company_of_job"][j]),
+            int(problem["job_ids"][j]),
+            int(problem["pref_order"][s, k])
+        ))
+    return results
+
+
+# =========================================================
+# 寫入結果
+# =========================================================
+def save_run(conn, results, algorithm, tie_break, seed, created_by):
+    cursor = conn.cursor()
+    try:
+        placed = sum(1 for r in results if r[2] is not None)
+        cursor.execute("""
+            INSERT INTO placement_runs (algorithm, tie_break, seed, student_count, placed_count, created_by)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (algorithm, tie_break, seed, len(results), placed, created_by))
+        run_id = cursor.lastrowid
+        for i in range(0, len(results), 1000):
+            cursor.executemany("""
+                INSERT INTO placement_results (run_id, student_id, company_id, job_id, preference_order)
+                VALUES (%s, %s, %s, %s, %s)
+            """, [(run_id,) + r for r in results[i:i + 1000]])
+        # 名額帳本：以本次結果取代前一次的分發名額，超賣時整批回滾
+        record_placements(cursor, run_id, [(r[0], r[2]) for r in results if r[2] is not None], created_by)
+        conn.commit()
+        return run_id, placed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def load_latest_results(cursor, student_id=None):
+    """
+    最新一次分發結果（含學生、班級、公司、職缺名稱）；尚未分發時回傳 (None, [])
+    指定 student_id 時只回傳該學生的結果（以主鍵 (run_id, student_id) 查詢）
+    """
+    cursor.execute("SELECT * FROM placement_runs ORDER BY id DESC LIMIT 1")
+    run = cursor.fetchone()
+    if not run:
+        return None, []
+    params = [run["id"]]
+    student_filter = ""
+    if student_id is not None:
+        student_filter = "AND pr.student_id = %s"
+        params.append(student_id)
+    cursor.execute(f"""
+        SELECT pr.student_id, u.name AS student_name, u.username AS student_number,
+               c.name AS class_name, pr.preference_order,
+               ic.company_name, ij.title AS job_title
+        FROM placement_results pr
+        JOIN users u ON u.id = pr.student_id
+        LEFT JOIN classes c ON u.class_id = c.id
+        LEFT JOIN internship_companies ic ON ic.id = pr.company_id
+        LEFT JOIN internship_jobs ij ON ij.id = pr.job_id
+        WHERE pr.run_id = %s {student_filter}
+        ORDER BY c.name, u.name
+    """, params)
+    return run, cursor.fetchall()
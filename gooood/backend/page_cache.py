@@ -0,0 +1,65 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, make_response, request
+
+# =========================================================
+# 公開頁面整頁快取
+#   - 登入、註冊、訪客首頁、公告內容等頁面與登入者無關，渲染結果以 (網址, 資料版本) 為鍵
+#     存在記憶體（每個 worker 各一份，LRU）
+#   - 回應帶 ETag 與 Cache-Control: public，前端 proxy / 瀏覽器可直接快取；If-None-Match 相符回 304
+#   - 這些 view 不讀寫 session，不會替訪客產生 session cookie（proxy 才能共用同一份回應）
+#   - 模板版本即程序載入的模板（正式環境關閉 auto_reload，部署後重啟即換新）；
+#     auto_reload 開啟（開發環境）時不快取，改模板立即生效
+# =========================================================
+
+MAX_AGE = 60
+MAX_ENTRIES = 500
+
+_lock = threading.Lock()
+_pages = OrderedDict()   # {(full_path, data_version): (body, content_type, etag)}
+
+
+def cached_page(version=None, max_age=MAX_AGE):
+    """
+    公開頁面的 view 裝飾器
+      version(**view_args) - 回傳頁面資料的版本（資料變動時改變）；省略表示頁面只依模板而定
+    只快取 200 回應；快取命中時不呼叫 view
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            if current_app.jinja_env.auto_reload:
+                return view(**view_args)
+
+            key = (request.full_path, version(**view_args) if version else None)
+            with _lock:
+                entry = _pages.get(key)
+                if entry is not None:
+                    _pages.move_to_end(key)
+
+            if entry is None:
+                response = make_response(view(**view_args))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (body, response.content_type, hashlib.sha1(body).hexdigest())
+                with _lock:
+                    _pages[key] = entry
+                    while len(_pages) > MAX_ENTRIES:
+                        _pages.popitem(last=False)
+
+            body, content_type, etag = entry
+            response = current_app.response_class(body, content_type=content_type)
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def clear():
+    with _lock:
+        _pages.clear()
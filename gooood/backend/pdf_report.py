@@ -0,0 +1,290 @@
+import os
+import re
+import traceback
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# =========================================================
+# PDF 表格報表（中文）
+#   - 中文字型由 register_fonts() 註冊一次（正式環境在 warm_up() 時，fork worker 之前）：
+#     優先使用 TrueType 字型（reportlab 只嵌入用到的字形子集，輸出與閱讀器無關）；
+#     都找不到時改用 PDF 閱讀器內建的 MSung-Light（不嵌入，顯示結果依閱讀器字型而定），並印出警告
+#   - 直接在 canvas 上逐頁畫表格；只有超過欄寬的儲存格才斷行，其餘直接輸出字串
+#   - 中文逐字斷行，英數字串（單字、數字、email）整段保留，放不下時才拆開
+#   - 表頭只排版一次（Form XObject），每頁重複引用
+# =========================================================
+
+# 可用 PDF_CJK_FONT 指定字型檔（.ttf / .ttc，需為 TrueType 外框；Noto Sans TC 的 OTF 版本為 CFF 外框，無法使用）
+CJK_FONT_CANDIDATES = (
+    os.getenv("PDF_CJK_FONT", ""),
+    os.path.join(os.path.dirname(__file__), "fonts", "NotoSansTC-Regular.ttf"),
+    "C:/Windows/Fonts/msjh.ttc",
+    "C:/Windows/Fonts/kaiu.ttf",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/arphic/uming.ttc",
+)
+CJK_FONT_NAME = "CJK"
+FALLBACK_FONT_NAME = "MSung-Light"
+
+PAGE_SIZE = landscape(A4)
+MARGIN = 0.5 * inch
+HEADER_COLOR = colors.HexColor('#0066CC')
+STRIPE_COLOR = colors.HexColor('#F9F9F9')
+GRID_COLOR = colors.grey
+PADDING = 3
+
+# 斷行單位：英數字串 / 空白 / 其他單一字元（中文、標點）
+_TOKEN_RE = re.compile(r"[A-Za-z0-9@._\-+/:%#&'’]+|\s+|.", re.S)
+
+_font = None
+
+
+def register_fonts():
+    """註冊中文字型並回傳字型名稱（只做一次）"""
+    global _font
+    if _font is not None:
+        return _font
+    for path in CJK_FONT_CANDIDATES:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(CJK_FONT_NAME, path, subfontIndex=0))
+            print(f"✅ PDF 中文字型：{path}（嵌入字形子集）")
+            _font = CJK_FONT_NAME
+            return _font
+        except Exception:
+            print(f"⚠️ 無法使用字型檔 {path}（需為 TrueType 外框）：", traceback.format_exc())
+    pdfmetrics.registerFont(UnicodeCIDFont(FALLBACK_FONT_NAME))
+    print(f"⚠️ 找不到 TrueType 中文字型，PDF 改用不嵌入的 {FALLBACK_FONT_NAME}；"
+          f"請以 PDF_CJK_FONT 指定字型檔或放到 fonts/NotoSansTC-Regular.ttf")
+    _font = FALLBACK_FONT_NAME
+    return _font
+
+
+def _split_long(token, font, size, width):
+    """單一英數字串比欄寬還長時逐字拆開"""
+    string_width = pdfmetrics.stringWidth
+    parts, current = [], ""
+    for ch in token:
+        if current and string_width(current + ch, font, size) > width:
+            parts.append(current)
+            current = ch
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def wrap_text(text, font, size, width):
+    """
+    依欄寬斷行，回傳每行字串 list；每行寬度都不超過 width
+    （欄寬連一個字都放不下時，該行只放一個字）
+    """
+    string_width = pdfmetrics.stringWidth
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        current, current_width = "", 0.0
+        for token in _TOKEN_RE.findall(paragraph):
+            if token.isspace():
+                if current:  # 行首的空白略過
+                    current += " "
+                    current_width += string_width(" ", font, size)
+                continue
+            token_width = string_width(token, font, size)
+            if current_width + token_width <= width:
+                current += token
+                current_width += token_width
+                continue
+            if current.strip():
+                lines.append(current.rstrip())
+            current, current_width = "", 0.0
+            if token_width <= width:
+                current, current_width = token, token_width
+            else:
+                *full, current = _split_long(token, font, size, width)
+                lines.extend(full)
+                current_width = string_width(current, font, size)
+        lines.append(current.rstrip())
+
+    # 檢查：任何一行仍超過欄寬（例如字寬計算與斷行單位不一致）時逐字拆開
+    checked = []
+    for line in lines:
+        if len(line) > 1 and string_width(line, font, size) > width:
+            checked.extend(_split_long(line, font, size, width))
+        else:
+            checked.append(line)
+    return checked
+
+
+class TableReport:
+    """
+    逐頁輸出的表格報表
+        report = TableReport(out, title, subtitle)
+        report.table(headers, widths, rows, wrap_columns={4, 5})
+        report.save()
+    widths 為相對寬度，會依頁面可用寬度等比例縮放
+    """
+
+    def __init__(self, out, title, subtitle=None, font_size=8, header_font_size=10):
+        self.font = register_fonts()
+        self.canvas = canvas.Canvas(out, pagesize=PAGE_SIZE, pageCompression=1)
+        self.width, self.height = PAGE_SIZE
+        self.font_size = font_size
+        self.header_font_size = header_font_size
+        self.leading = font_size + 2
+        self._forms = 0
+        self.y = self.height - MARGIN
+        self.canvas.setTitle(title)
+
+        self._text(title, 16, HEADER_COLOR, center=True)
+        self.y -= 6
+        if subtitle:
+            self._text(subtitle, 9, colors.black)
+        self.y -= 8
+
+    def _text(self, text, size, color, center=False):
+        self.y -= size + 2
+        self.canvas.setFont(self.font, size)
+        self.canvas.setFillColor(color)
+        if center:
+            self.canvas.drawCentredString(self.width / 2, self.y, text)
+        else:
+            self.canvas.drawString(MARGIN, self.y, text)
+
+    def heading(self, text, size=12):
+        if self.y - size - 2 < MARGIN + self.leading * 3:
+            self._new_page()
+        self.y -= 8
+        self._text(text, size, colors.black)
+        self.y -= 6
+
+    def _new_page(self):
+        self.canvas.showPage()
+        self.y = self.height - MARGIN
+
+    # -------------------------
+    # 表格
+    # -------------------------
+    def _header_form(self, name, headers, widths):
+        """表頭只排版一次，回傳列高；之後每頁以 doForm 引用"""
+        size = self.header_font_size
+        lines = [wrap_text(h, self.font, size, w - 2 * PADDING) for h, w in zip(headers, widths)]
+        height = max(len(l) for l in lines) * (size + 2) + 2 * PADDING
+        total = sum(widths)
+
+        c = self.canvas
+        c.beginForm(name, lowerx=0, lowery=-height, upperx=total, uppery=0)
+        c.setFillColor(HEADER_COLOR)
+        c.rect(0, -height, total, height, stroke=0, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont(self.font, size)
+        x = 0
+        for cell_lines, w in zip(lines, widths):
+            for n, line in enumerate(cell_lines):
+                c.drawString(x + PADDING, -PADDING - size - n * (size + 2), line)
+            x += w
+        self._grid(0, 0, widths, height)
+        c.endForm()
+        return height
+
+    def _grid(self, x0, top, widths, height):
+        c = self.canvas
+        c.setStrokeColor(GRID_COLOR)
+        c.setLineWidth(0.5)
+        total = sum(widths)
+        c.rect(x0, top - height, total, height, stroke=1, fill=0)
+        x = x0
+        for w in widths[:-1]:
+            x += w
+            c.line(x, top, x, top - height)
+
+    def table(self, headers, widths, rows, wrap_columns=()):
+        """
+        rows 可為產生器；每列為字串 list
+        wrap_columns 中的欄位超過欄寬時斷行，其餘欄位超過時截斷
+        """
+        scale = (self.width - 2 * MARGIN) / sum(widths)
+        widths = [w * scale for w in widths]
+        self._forms += 1
+        form_name = f"header{self._forms}"
+        header_height = self._header_form(form_name, headers, widths)
+
+        c = self.canvas
+        size, leading = self.font_size, self.leading
+        inner = [w - 2 * PADDING for w in widths]
+        string_width = pdfmetrics.stringWidth
+        font = self.font
+
+        total = sum(widths)
+        segment_top = None  # 本頁表格區段的上緣；換頁或結束時一次畫直線與外框
+
+        def close_segment():
+            if segment_top is not None and segment_top > self.y:
+                self._grid(MARGIN, segment_top, widths, segment_top - self.y)
+
+        def place_header():
+            nonlocal segment_top
+            if self.y - header_height - leading - 2 * PADDING < MARGIN:
+                close_segment()
+                self._new_page()
+            c.saveState()
+            c.translate(MARGIN, self.y)
+            c.doForm(form_name)
+            c.restoreState()
+            self.y -= header_height
+            segment_top = self.y
+
+        place_header()
+        c.setStrokeColor(GRID_COLOR)
+        c.setLineWidth(0.5)
+        for index, row in enumerate(rows):
+            cells = []
+            for col, value in enumerate(row):
+                text = "" if value is None else str(value)
+                if not text or string_width(text, font, size) <= inner[col]:
+                    cells.append([text] if text else [])
+                elif col in wrap_columns:
+                    cells.append(wrap_text(text, font, size, inner[col]))
+                else:
+                    while text and string_width(text + "…", font, size) > inner[col]:
+                        text = text[:-1]
+                    cells.append([text + "…"])
+            height = max(1, max((len(l) for l in cells), default=1)) * leading + 2 * PADDING
+
+            if self.y - height < MARGIN:
+                close_segment()
+                self._new_page()
+                place_header()
+                c.setStrokeColor(GRID_COLOR)
+                c.setLineWidth(0.5)
+
+            top = self.y
+            if index % 2:
+                c.setFillColor(STRIPE_COLOR)
+                c.rect(MARGIN, top - height, total, height, stroke=0, fill=1)
+
+            # 一列只用一個文字物件
+            text_object = c.beginText()
+            text_object.setFont(font, size)
+            text_object.setFillColor(colors.black)
+            x = MARGIN
+            for lines, w in zip(cells, widths):
+                for n, line in enumerate(lines):
+                    text_object.setTextOrigin(x + PADDING, top - PADDING - size - n * leading)
+                    text_object.textOut(line)
+                x += w
+            c.drawText(text_object)
+            c.line(MARGIN, top - height, MARGIN + total, top - height)
+            self.y -= height
+
+        close_segment()
+
+    def save(self):
+        self.canvas.save()
@@ -0,0 +1,15 @@
+import sys
+from app import JINJA_CACHE_DIR, create_app, warm_up
+
+# =========================================================
+# 部署步驟：預先編譯 frontend/templates 與 admin_frontend/templates 的所有模板
+#   - 結果寫入 Jinja bytecode cache（JINJA_CACHE_DIR），所有 worker 共用
+#   - 部署新版模板後執行一次：cd backend && python precompile_templates.py
+# =========================================================
+
+if __name__ == "__main__":
+    app = create_app()
+    app.jinja_env.bytecode_cache.clear()  # 清掉舊版模板的編譯結果
+    count, failed = warm_up(app)
+    print(f"✅ 已編譯 {count} 個模板 → {JINJA_CACHE_DIR}")
+    sys.exit(1 if failed else 0)
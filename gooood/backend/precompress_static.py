@@ -0,0 +1,49 @@
+import gzip
+import os
+import sys
+from app import FRONTEND_DIR
+from compression import MIN_SIZE, brotli
+
+# =========================================================
+# 部署步驟：預先壓縮靜態檔
+#   - CSS / JS / SVG / JSON 等文字檔超過 MIN_SIZE 時，在旁邊產生 .gz（與安裝了 brotli 時的 .br）
+#   - static 路由依 Accept-Encoding 直接送出壓縮檔，請求時不必再壓縮
+#   - 用法：cd backend && python precompress_static.py
+# =========================================================
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".svg", ".json", ".txt", ".html", ".map"}
+STATIC_DIRS = [os.path.join(FRONTEND_DIR, "static")]
+
+
+def _write_if_smaller(path, data, compressed):
+    if len(compressed) < len(data):
+        with open(path, "wb") as f:
+            f.write(compressed)
+        return True
+    if os.path.exists(path):
+        os.remove(path)  # 舊的壓縮檔已不適用
+    return False
+
+
+def precompress(directory):
+    """回傳產生的壓縮檔數"""
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            count += _write_if_smaller(path + ".gz", data, gzip.compress(data, 9, mtime=0))
+            if brotli:
+                count += _write_if_smaller(path + ".br", data, brotli.compress(data, quality=11))
+    return count
+
+
+if __name__ == "__main__":
+    dirs = sys.argv[1:] or STATIC_DIRS
+    total = sum(precompress(d) for d in dirs)
+    print(f"✅ 已產生 {total} 個預先壓縮檔")
@@ -0,0 +1,316 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from config import get_db
+from preference_store import lock_version, write_diff, with_retry
+
+# =========================================================
+# 志願截止前的寫入緩衝（surge mode）
+#   - 設定 PREFERENCE_SURGE_MODE=1 啟用
+#   - 送出時先附加到本機日誌檔（fsync）並放進記憶體，立即回覆學生
+#   - 同一位學生在緩衝期間重複送出只保留最後一次（last write wins）
+#   - 背景執行緒每 FLUSH_INTERVAL 秒把緩衝批次寫入 student_preferences
+#   - 學生讀取自己的志願時先看緩衝（read-through），一定看到最新送出的內容：
+#     送出時另寫一份 latest/<student_id>/<送出時間>.json 到共用的 SPOOL_DIR，
+#     不論讀取請求由哪個 worker 處理都看得到；寫入資料庫後才刪除
+#   - 日誌檔以程序自己的隨機代號命名，開啟期間以 flock 鎖住；鎖得到的日誌檔代表擁有者已結束，
+#     由其他 worker 的背景執行緒或下一次啟動（recover_journals()，不論是否啟用 surge mode）寫入資料庫
+#   - 跨 worker 的先後以送出時間判斷（preference_write_marks），較舊的送出不會覆蓋較新的
+# =========================================================
+
+SURGE_MODE = os.getenv("PREFERENCE_SURGE_MODE", "0") == "1"
+SPOOL_DIR = os.getenv("PREFERENCE_SPOOL_DIR", os.path.join(os.path.dirname(__file__), "spool"))
+FLUSH_INTERVAL = 1.0
+RECOVER_INTERVAL = 30.0
+BATCH_SIZE = 200
+
+_lock = threading.Lock()
+_pending = {}     # {student_id: (submitted_ts, desired)}
+_inflight = {}    # 正在寫入資料庫的批次（寫完前本 worker 仍直接從這裡讀）
+_journal = None
+_journal_path = None
+_segment = 0
+_token = None     # 本程序的日誌檔代號（pid 可能被重新啟動的 worker 重複使用，不能拿來判斷擁有者）
+_owner_pid = None
+
+
+# -------------------------
+# 日誌檔：每個程序一組 pref-<代號>-<segment>.log，寫入資料庫後整段刪除
+#   先以 .opening 暫名建立並上鎖，再改成正式檔名，其他 worker 不會看到尚未上鎖的日誌檔
+# -------------------------
+def _segment_path(token, segment):
+    return os.path.join(SPOOL_DIR, f"pref-{token}-{segment}.log")
+
+
+def _open_segment():
+    global _journal, _journal_path, _segment
+    _segment += 1
+    path = _segment_path(_token, _segment)
+    journal = open(f"{path}.opening", "x", encoding="utf-8")  # 不沿用既有的檔案
+    fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+    os.rename(f"{path}.opening", path)
+    _journal, _journal_path = journal, path
+    return path
+
+
+# -------------------------
+# 尚未寫入資料庫的最新送出：latest/<student_id>/<送出時間>.json（所有 worker 共用）
+#   每次送出各自一個檔案；寫入資料庫後刪除該次及更早的送出，不會誤刪同一學生較新的送出
+# -------------------------
+def _latest_dir(student_id):
+    return os.path.join(SPOOL_DIR, "latest", str(int(student_id)))
+
+
+def _latest_path(student_id, submitted_ts):
+    return os.path.join(_latest_dir(student_id), f"{submitted_ts:.6f}.json")
+
+
+def _write_latest(student_id, submitted_ts, desired):
+    path = _latest_path(student_id, submitted_ts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_encode(desired), f)
+    os.replace(tmp, path)  # 讀取端不會讀到寫一半的檔案
+
+
+def _read_latest(student_id):
+    """回傳 (submitted_ts, desired)；沒有尚未寫入的送出時回傳 None"""
+    try:
+        names = os.listdir(_latest_dir(student_id))
+    except FileNotFoundError:
+        return None
+    for name in sorted((n for n in names if n.endswith(".json")), key=lambda n: float(n[:-5]), reverse=True):
+        try:
+            with open(os.path.join(_latest_dir(student_id), name), encoding="utf-8") as f:
+                return float(name[:-5]), _decode(json.load(f))
+        except FileNotFoundError:
+            continue  # 剛好被寫入完成的 worker 刪除，改看下一份
+    return None
+
+
+def _remove_latest(student_id, submitted_ts):
+    """刪除送出時間 <= submitted_ts 的檔案（已寫入或已被較新的送出取代）"""
+    try:
+        names = os.listdir(_latest_dir(student_id))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(".json") and float(name[:-5]) <= submitted_ts:
+            try:
+                os.remove(os.path.join(_latest_dir(student_id), name))
+            except FileNotFoundError:
+                pass
+
+
+def _encode(desired):
+    return [[order, company_id, job_id] for order, (company_id, job_id) in sorted(desired.items())]
+
+
+def _decode(items):
+    return {int(order): (int(company_id), int(job_id) if job_id is not None else None)
+            for order, company_id, job_id in items}
+
+
+def _claim(path):
+    """對孤兒日誌檔上鎖，回傳開啟的檔案；擁有者仍在執行（鎖不到）或已被處理時回傳 None"""
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)  # 上鎖前已被其他 worker 處理並刪除
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _recover_orphans():
+    """把已結束程序留下的日誌檔寫入資料庫；寫入成功才刪除，失敗時留待下一次"""
+    claimed = [f for f in map(_claim, glob.glob(os.path.join(SPOOL_DIR, "pref-*.log"))) if f is not None]
+    if not claimed:
+        return 0
+    try:
+        latest = {}
+        for f in claimed:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 程序中斷時最後一行可能不完整
+                current = latest.get(entry["student_id"])
+                if current is None or current[0] < entry["ts"]:
+                    latest[entry["student_id"]] = (entry["ts"], _decode(entry["preferences"]))
+
+        items = sorted(latest.items())
+        conn = get_db()
+        try:
+            for i in range(0, len(items), BATCH_SIZE):
+                with_retry(_write_batch, conn, items[i:i + BATCH_SIZE])
+        finally:
+            conn.close()
+
+        for f in claimed:
+            os.remove(f.name)
+        for student_id, (submitted_ts, _) in items:
+            _remove_latest(student_id, submitted_ts)
+    finally:
+        for f in claimed:
+            f.close()
+    return len(claimed)
+
+
+def recover_journals():
+    """啟動時呼叫：寫入上一次執行留下的日誌檔（不論是否啟用 surge mode）"""
+    try:
+        count = _recover_orphans()
+        if count:
+            print(f"✅ 已復原 {count} 個志願日誌檔")
+    except Exception:
+        print("❌ 志願日誌復原錯誤：", traceback.format_exc())
+
+
+def _start():
+    """第一次使用時開啟日誌檔並啟動背景寫入（fork 後的子程序會重新啟動自己的）"""
+    global _owner_pid, _pending, _inflight, _segment, _token
+    if _owner_pid == os.getpid():
+        return
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    _owner_pid = os.getpid()
+    _pending, _inflight, _segment, _token = {}, {}, 0, uuid.uuid4().hex
+    _open_segment()
+    threading.Thread(target=_flush_loop, name="preference-flusher", daemon=True).start()
+    atexit.register(flush)
+
+
+# -------------------------
+# 對外介面
+# -------------------------
+def enqueue(student_id, desired, submitted_ts=None):
+    """寫入日誌並放進緩衝；回傳時資料已落地，可直接回覆學生"""
+    submitted_ts = round(submitted_ts or time.time(), 6)  # 與 latest/ 檔名的精度一致
+    line = json.dumps({"student_id": student_id, "ts": submitted_ts, "preferences": _encode(desired)})
+    with _lock:
+        _start()
+        _journal.write(line + "\n")
+        _journal.flush()
+        os.fsync(_journal.fileno())
+        current = _pending.get(student_id)
+        if current is None or current[0] <= submitted_ts:
+            _pending[student_id] = (submitted_ts, desired)
+    _write_latest(student_id, submitted_ts, desired)
+    return submitted_ts
+
+
+def buffered_preferences(student_id):
+    """
+    read-through：回傳該學生尚未寫入資料庫的最新志願 {志願序: (company_id, job_id)}，沒有則為 None
+    先看本 worker 的緩衝，再看共用 SPOOL_DIR 中其他 worker 收到的送出，取送出時間較新的
+    """
+    with _lock:
+        entry = _pending.get(student_id) or _inflight.get(student_id)
+    shared = _read_latest(student_id)
+    if shared is not None and (entry is None or shared[0] > entry[0]):
+        entry = shared
+    return entry[1] if entry else None
+
+
+def _write_batch(conn, batch):
+    """單一交易寫入一批學生；依 student_id 排序鎖定，避免與其他 worker 互相 deadlock"""
+    cursor = conn.cursor()
+    try:
+        conn.rollback()
+        written = 0
+        for student_id, (submitted_ts, desired) in batch:
+            lock_version(cursor, student_id)
+            cursor.execute(
+                "SELECT submitted_ts FROM preference_write_marks WHERE student_id = %s", (student_id,))
+            row = cursor.fetchone()
+            if row and row[0] >= submitted_ts:
+                continue  # 其他 worker 已寫入更新的送出
+            write_diff(cursor, student_id, desired)
+            cursor.execute("""
+                INSERT INTO preference_write_marks (student_id, submitted_ts) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE submitted_ts = VALUES(submitted_ts)
+            """, (student_id, submitted_ts))
+            written += 1
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def flush():
+    """把目前緩衝全部寫入資料庫；失敗的批次放回緩衝，日誌檔保留到寫入成功為止"""
+    global _pending, _inflight
+    with _lock:
+        if _owner_pid != os.getpid() or not _pending:
+            return 0
+        batch, _pending = _pending, {}
+        _inflight = batch
+        old_journal, old_path = _journal, _journal_path
+        _open_segment()  # 之後的送出寫到新的日誌檔；舊的保持開啟（上鎖）到寫入完成
+
+    items = sorted(batch.items())
+    written = 0
+    conn = None
+    try:
+        conn = get_db()
+        for i in range(0, len(items), BATCH_SIZE):
+            written += with_retry(_write_batch, conn, items[i:i + BATCH_SIZE])
+    except Exception:
+        print("❌ 志願緩衝寫入錯誤：", traceback.format_exc())
+        with _lock:
+            # 寫入失敗：舊資料放回緩衝（較新的送出優先），並重新寫進新的日誌檔
+            for student_id, entry in batch.items():
+                current = _pending.get(student_id)
+                if current is None or current[0] < entry[0]:
+                    _pending[student_id] = entry
+                    _journal.write(json.dumps({"student_id": student_id, "ts": entry[0],
+                                               "preferences": _encode(entry[1])}) + "\n")
+            _journal.flush()
+            os.fsync(_journal.fileno())
+            _inflight = {}
+        os.remove(old_path)
+        old_journal.close()
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+
+    with _lock:
+        _inflight = {}
+    os.remove(old_path)
+    old_journal.close()
+    for student_id, (submitted_ts, _) in items:
+        _remove_latest(student_id, submitted_ts)
+    return written
+
+
+def _flush_loop():
+    pid = os.getpid()
+    recovered_at = 0.0
+    while _owner_pid == pid:
+        if time.monotonic() - recovered_at >= RECOVER_INTERVAL:
+            recovered_at = time.monotonic()
+            try:
+                _recover_orphans()
+            except Exception:
+                print("❌ 志願日誌復原錯誤：", traceback.format_exc())
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            print("❌ 志願緩衝寫入錯誤：", traceback.format_exc())
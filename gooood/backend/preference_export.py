@@ -0,0 +1,510 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from catalog_cache import CATALOG_KEY, read_version
+from preference_snapshot import class_preference_rows, latest_snapshot
+from preference_store import class_version_key
+from docx_report import DocxTemplate, PAGE_BREAK, fill, row_formatter
+
+# =========================================================
+# 志願匯出
+#   - PreferenceDataset：每班一份欄式資料（每個志願序一組欄位），三種格式共用
+#   - render_excel / render_word / render_pdf：由 dataset 產生檔案，寫入 out（檔案或串流）
+#   - 產生過的檔案存在磁碟，鍵為 (班級, 資料版本, 格式)；資料版本包含
+#     班級志願版本、公司目錄版本、快照 id 與班級學生名單（姓名 / 學號 / 轉班），任何一項變動都會產生新的檔案
+#   - 快取的檔案內容只依資料而定（凍結時間或「即時資料」），不含導出時間；導出時間放在下載檔名
+#   - 多班匯出時每班在程序池中平行產生；每個 worker 共用一個最多 RENDER_WORKERS 個子程序的池
+#   - xlsxwriter / python-docx / reportlab 在第一次產生該格式時才載入，
+#     一般請求的 worker 不必付出這些套件的啟動時間與記憶體
+# =========================================================
+
+MAX_PREFERENCES = 5
+PREFERENCE_LABELS = ['第一志願', '第二志願', '第三志願', '第四志願', '第五志願']
+CACHE_DIR = os.getenv("PREFERENCE_EXPORT_CACHE_DIR", os.path.join(os.path.dirname(__file__), "export_cache"))
+# 舊版本的檔案超過這個秒數才刪除（同時產生不同版本的請求不會互相刪掉剛寫好的檔案）
+CACHE_GRACE = 300
+RENDER_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+
+class PreferenceDataset:
+    """
+    一個班級的志願表（欄式）
+      names / numbers       - 每位學生一格
+      company[k] / job[k] / address[k] / contact[k] / phone[k] / submitted[k]
+                            - 第 k+1 志願，每位學生一格（未填為 '' / None）
+    """
+
+    SLOT_FIELDS = ("company", "job", "address", "contact", "phone", "submitted")
+
+    def __init__(self, class_id, class_name, frozen_at=None):
+        self.class_id = class_id
+        self.class_name = class_name
+        self.frozen_at = frozen_at    # 快照的凍結時間；即時資料為 None
+        self.names = []
+        self.numbers = []
+        for field in self.SLOT_FIELDS:
+            setattr(self, field, [[] for _ in range(MAX_PREFERENCES)])
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_rows(cls, class_id, class_name, rows, frozen_at=None):
+        """rows 依姓名、志願序排序（class_preference_rows 的結果）"""
+        ds = cls(class_id, class_name, frozen_at)
+        index = {}
+        for row in rows:
+            if not row["student_name"]:
+                continue
+            i = index.get(row["student_id"])
+            if i is None:
+                i = index[row["student_id"]] = len(ds.names)
+                ds.names.append(row["student_name"])
+                ds.numbers.append(row["student_number"] or "")
+                for field in cls.SLOT_FIELDS:
+                    for column in getattr(ds, field):
+                        column.append(None if field == "submitted" else "")
+            order = row["preference_order"]
+            if order and row["company_name"] and 1 <= order <= MAX_PREFERENCES:
+                k = order - 1
+                ds.company[k][i] = row["company_name"]
+                ds.job[k][i] = row["job_title"] or ""
+                ds.address[k][i] = row["company_address"] or ""
+                ds.contact[k][i] = row["contact_name"] or ""
+                ds.phone[k][i] = row["contact_phone"] or row["contact_email"] or ""
+                ds.submitted[k][i] = row["submitted_at"]
+        return ds
+
+    def company_counts(self):
+        """[(公司, 被選擇次數)]，次數多的在前"""
+        counts = Counter(c for column in self.company for c in column if c)
+        return counts.most_common()
+
+    def job_counts(self):
+        """[((公司, 職缺), 被選擇次數)]，次數多的在前"""
+        counts = Counter(
+            (c, j)
+            for companies, jobs in zip(self.company, self.job)
+            for c, j in zip(companies, jobs) if c
+        )
+        return counts.most_common()
+
+    def preference_text(self, k, i, time_format='%m/%d %H:%M'):
+        """試算表 / 文件儲存格用：公司名稱＋換行＋送出時間"""
+        text = self.company[k][i]
+        if text and self.submitted[k][i]:
+            text += f"\n({self.submitted[k][i].strftime(time_format)})"
+        return text
+
+
+# -------------------------
+# 資料
+# -------------------------
+def roster_version(cursor, class_id):
+    """
+    班級學生名單的指紋（人數 + 每位學生 id / 姓名 / 學號的 CRC32 XOR）
+    學生改名、改學號、轉入轉出都會改變；不需要在每個修改使用者的地方遞增版本號
+    """
+    cursor.execute("""
+        SELECT COUNT(*) AS n, COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, name, username))), 0) AS digest
+        FROM users
+        WHERE class_id = %s AND role = 'student'
+    """, (class_id,))
+    row = cursor.fetchone()
+    return f"{row['n']}-{row['digest']}"
+
+
+def data_version(cursor, class_id):
+    """(班級志願版本, 公司目錄版本, 快照 id, 學生名單) 組成的版本字串（dictionary cursor）"""
+    prefs_version = read_version(cursor, class_version_key(class_id))
+    catalog_version = read_version(cursor, CATALOG_KEY)
+    snapshot = latest_snapshot(cursor, class_id)
+    return f"{prefs_version}.{catalog_version}.{snapshot['id'] if snapshot else 0}.{roster_version(cursor, class_id)}"
+
+
+def build_dataset(cursor, class_id, class_name):
+    snapshot, rows = class_preference_rows(cursor, class_id)
+    return PreferenceDataset.from_rows(class_id, class_name, rows, snapshot["cutoff_at"] if snapshot else None)
+
+
+def data_status(ds):
+    """標題下方的資料說明（只依資料而定，快取的檔案內容不會過時）"""
+    if ds.frozen_at:
+        return f"志願凍結時間：{ds.frozen_at.strftime('%Y年%m月%d日 %H:%M:%S')}"
+    return "資料狀態：即時資料（志願尚未凍結）"
+
+
+# -------------------------
+# Excel
+#   excel_layout 先排好一個班級工作表的內容（可在子程序執行），write_workbook 再逐列寫出
+#   使用 xlsxwriter constant_memory：每寫完一列就落到暫存檔，記憶體用量與列數無關
+# -------------------------
+EXCEL_COLUMN_WIDTHS = [15, 12, 20, 20, 20, 20, 20]
+EXCEL_FORMATS = {
+    "title": {"bold": True, "font_size": 16, "font_color": "#0066CC", "align": "center", "valign": "vcenter"},
+    "date": {"align": "center"},
+    "header": {"bold": True, "font_color": "#FFFFFF", "bg_color": "#0066CC",
+               "align": "center", "valign": "vcenter", "border": 1},
+    "cell": {"border": 1},
+    "wrap": {"border": 1, "text_wrap": True, "valign": "top"},
+    "bold": {"bold": True},
+}
+_SHEET_TITLE_RE = re.compile(r"[\[\]:*?/\\]")
+
+
+def excel_layout(ds):
+    """
+    回傳 {"title", "rows", "merges"}
+      rows   - [(儲存格 [(值, 樣式名稱)], 列高)]，依序對應第 1 列起的每一列
+      merges - {列索引: 合併到的最後一欄索引}
+    """
+    rows = [
+        ([(f"{ds.class_name} - 學生實習志願序統計表", "title")], None),
+        ([(data_status(ds), "date")], None),
+        ([], None),
+        ([(header, "header") for header in ['學生姓名', '學號'] + PREFERENCE_LABELS], None),
+    ]
+    for i in sorted(range(len(ds)), key=lambda i: ds.names[i]):
+        cells = [(ds.names[i], "cell"), (ds.numbers[i], "cell")]
+        cells += [(ds.preference_text(k, i), "wrap") for k in range(MAX_PREFERENCES)]
+        rows.append((cells, 40))
+
+    rows.append(([], None))
+    rows.append(([("統計資訊：", "bold")], None))
+    rows.append(([("公司名稱", "bold"), ("被選擇次數", "bold")], None))
+    rows.extend(([(company, None), (count, None)], None) for company, count in ds.company_counts())
+    return {"title": f"{ds.class_name}志願序", "rows": rows, "merges": {0: 6, 1: 6}}
+
+
+def _sheet_title(title, used):
+    """Excel 工作表名稱：去掉不允許的字元、最多 31 字、不可重複"""
+    base = _SHEET_TITLE_RE.sub("", title)[:31] or "Sheet"
+    name, n = base, 1
+    while name in used:
+        n += 1
+        name = f"{base[:31 - len(str(n)) - 1]}_{n}"
+    used.add(name)
+    return name
+
+
+def write_cell(ws, row, col, value, cell_format=None):
+    """字串一律以文字寫入（避免 '=' 開頭被當成公式、網址被轉成超連結）"""
+    if value is None or value == "":
+        ws.write_blank(row, col, None, cell_format)
+    elif isinstance(value, str):
+        ws.write_string(row, col, value, cell_format)
+    else:
+        ws.write(row, col, value, cell_format)
+
+
+def _write_sheet(ws, layout, formats):
+    for i, width in enumerate(EXCEL_COLUMN_WIDTHS):
+        ws.set_column(i, i, width)
+    merges = layout["merges"]
+    for r, (cells, height) in enumerate(layout["rows"]):
+        if height:
+            ws.set_row(r, height)
+        if r in merges and cells:
+            value, style = cells[0]
+            ws.merge_range(r, 0, r, merges[r], value, formats.get(style))
+            continue
+        for c, (value, style) in enumerate(cells):
+            write_cell(ws, r, c, value, formats.get(style))
+
+
+def write_workbook(layouts, out):
+    """把多個工作表內容逐列寫成一個活頁簿（每班一個工作表）"""
+    import xlsxwriter
+
+    wb = xlsxwriter.Workbook(out, {"constant_memory": True})
+    formats = {name: wb.add_format(props) for name, props in EXCEL_FORMATS.items()}
+    used = set()
+    for layout in layouts:
+        _write_sheet(wb.add_worksheet(_sheet_title(layout["title"], used)), layout, formats)
+    if not layouts:
+        wb.add_worksheet()
+    wb.close()
+
+
+def render_excel(ds, out):
+    write_workbook([excel_layout(ds)], out)
+
+
+# -------------------------
+# Word
+# -------------------------
+WORD_COLUMNS = [f"C{i}" for i in range(2 + MAX_PREFERENCES)]
+_word_template = None
+
+
+def _build_word_template():
+    """
+    以 python-docx 產生一次志願表範本（版面與原本逐格建立的文件相同），再切成可重複使用的片段
+    回傳 (範本, {"intro", "row", "middle", "stats_head", "stats_row", "stats_tail", "outro"})
+    """
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.enum.table import WD_TABLE_ALIGNMENT
+
+    doc = Document()
+    title = doc.add_heading("{{TITLE}}", 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.add_paragraph("{{DATA_STATUS}}")
+    doc.add_paragraph("")
+
+    table = doc.add_table(rows=2, cols=len(WORD_COLUMNS))
+    table.alignment = WD_TABLE_ALIGNMENT.CENTER
+    table.style = "Table Grid"
+    for i, header in enumerate(['學生姓名', '學號'] + PREFERENCE_LABELS):
+        table.rows[0].cells[i].text = header
+        table.rows[1].cells[i].text = f"{{{{{WORD_COLUMNS[i]}}}}}"
+
+    doc.add_paragraph("")
+    doc.add_heading("統計資訊", level=1)
+
+    stats_table = doc.add_table(rows=2, cols=2)
+    stats_table.style = "Table Grid"
+    stats_table.rows[0].cells[0].text = "公司名稱"
+    stats_table.rows[0].cells[1].text = "被選擇次數"
+    stats_table.rows[1].cells[0].text = "{{S0}}"
+    stats_table.rows[1].cells[1].text = "{{S1}}"
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    template = DocxTemplate(buffer.getvalue())
+
+    intro, row, rest = DocxTemplate.split_row(template.body, "C0")
+    middle, stats, outro = DocxTemplate.split_table(rest, "S0")
+    stats_head, stats_row, stats_tail = DocxTemplate.split_row(stats, "S0")
+    pieces = {
+        "intro": intro,
+        "row": row_formatter(row, WORD_COLUMNS),
+        "middle": middle,
+        "stats_head": stats_head,
+        "stats_row": row_formatter(stats_row, ["S0", "S1"]),
+        "stats_tail": stats_tail,
+        "outro": outro,
+    }
+    return template, pieces
+
+
+def word_template():
+    global _word_template
+    if _word_template is None:
+        _word_template = _build_word_template()
+    return _word_template
+
+
+def word_chunks(ds):
+    """一個班級的 Word 內文片段（產生器），每位學生一列"""
+    _, pieces = word_template()
+    yield fill(pieces["intro"], {"TITLE": f"{ds.class_name} - 學生實習志願序統計表", "DATA_STATUS": data_status(ds)})
+
+    row = pieces["row"]
+    order = sorted(range(len(ds)), key=lambda i: ds.names[i])
+    for start in range(0, len(order), 200):
+        yield "".join(
+            row([ds.names[i], ds.numbers[i]] + [ds.preference_text(k, i) for k in range(MAX_PREFERENCES)])
+            for i in order[start:start + 200]
+        )
+
+    yield pieces["middle"]
+    counts = ds.company_counts()
+    if counts:
+        stats_row = pieces["stats_row"]
+        yield pieces["stats_head"]
+        yield "".join(stats_row([company, count]) for company, count in counts)
+        yield pieces["stats_tail"]
+    yield pieces["outro"]
+
+
+def render_word(ds, out):
+    template, _ = word_template()
+    template.write(out, word_chunks(ds))
+
+
+# -------------------------
+# PDF
+# -------------------------
+PDF_HEADERS = ['學生姓名', '學號', '班級', '志願序', '公司名稱', '職缺', '公司地址', '聯絡人', '聯絡電話', '提交時間']
+PDF_WIDTHS = [1.3, 0.9, 0.9, 0.8, 2.2, 1.6, 2.4, 1.1, 1.2, 1.4]
+PDF_WRAP_COLUMNS = {4, 5, 6}
+
+
+def _pdf_rows(ds):
+    """每位學生五列（未填的志願留白）；逐列產生，不先建整張表"""
+    for i in sorted(range(len(ds)), key=lambda i: ds.names[i]):
+        for k in range(MAX_PREFERENCES):
+            submitted = ds.submitted[k][i]
+            yield [
+                ds.names[i], ds.numbers[i], ds.class_name, f"第{k+1}志願",
+                ds.company[k][i], ds.job[k][i], ds.address[k][i], ds.contact[k][i], ds.phone[k][i],
+                submitted.strftime('%Y/%m/%d %H:%M') if submitted and ds.company[k][i] else ''
+            ]
+
+
+def render_pdf(ds, out):
+    from pdf_report import TableReport
+
+    report = TableReport(out, f"{ds.class_name} - 學生實習志願序統計表", data_status(ds))
+    if len(ds):
+        report.table(PDF_HEADERS, PDF_WIDTHS, _pdf_rows(ds), wrap_columns=PDF_WRAP_COLUMNS)
+    else:
+        report.table(PDF_HEADERS, PDF_WIDTHS, [["沒有可顯示的資料"]])
+
+    # 統計資訊：公司(職缺) 被選擇次數
+    counts = ds.job_counts()
+    if counts:
+        report.heading("統計資訊：公司(職缺) 被選擇次數")
+        report.table(['公司名稱', '職缺', '被選擇次數'], [3, 2.5, 1],
+                     ([company, job, count] for (company, job), count in counts), wrap_columns={0, 1})
+    report.save()
+
+
+RENDERERS = {"xlsx": render_excel, "docx": render_word, "pdf": render_pdf}
+
+
+# -------------------------
+# 多班級匯出（系 / 全校）
+#   每班在子程序各自產生（Excel 為工作表內容，Word / PDF 為單班文件），再依班級順序合併
+# -------------------------
+def render_part(fmt, ds):
+    """子程序執行：Excel 回傳工作表內容，Word 回傳內文片段，PDF 回傳單班檔案內容"""
+    if fmt == "xlsx":
+        return excel_layout(ds)
+    if fmt == "docx":
+        return "".join(word_chunks(ds))
+    buffer = io.BytesIO()
+    RENDERERS[fmt](ds, buffer)
+    return buffer.getvalue()
+
+
+def combine_word(parts, out):
+    """把多個班級的內文片段寫成一份 Word，班級之間換頁"""
+    template, _ = word_template()
+
+    def chunks():
+        for n, part in enumerate(parts):
+            if n:
+                yield PAGE_BREAK
+            yield part
+
+    template.write(out, chunks())
+
+
+def combine_pdf(parts, out):
+    from pypdf import PdfWriter, PdfReader
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(io.BytesIO(part)))
+    writer.write(out)
+
+
+def _get_pool():
+    """每個程序各自建立程序池（gunicorn fork 出的 worker 不共用父程序的池）"""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def render_many(fmt, datasets, out):
+    """每班平行產生後合併寫入 out；只有一班時直接在本程序產生"""
+    if len(datasets) <= 1:
+        parts = [render_part(fmt, ds) for ds in datasets]
+    else:
+        parts = list(_get_pool().map(render_part, [fmt] * len(datasets), datasets))
+
+    if fmt == "xlsx":
+        write_workbook(parts, out)
+    elif not parts:
+        RENDERERS[fmt](PreferenceDataset(None, ""), out)
+    elif fmt == "docx":
+        combine_word(parts, out)
+    else:
+        combine_pdf(parts, out)
+
+
+# -------------------------
+# 磁碟快取
+# -------------------------
+def _cached(name, version, fmt, build):
+    """
+    回傳 (已開啟的檔案, etag)；同一 (name, version, fmt) 只產生一次
+    build(f) 把檔案內容寫進 f
+    直接開啟檔案而不先檢查是否存在：開啟後即使被其他請求刪除仍可讀完（POSIX）
+    新版本寫入後刪除同名同格式、超過 CACHE_GRACE 秒的舊檔
+    """
+    digest = hashlib.sha1(f"{name}:{version}".encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{name}-{digest}.{fmt}")
+    etag = f"{digest}-{fmt}"
+    try:
+        return open(path, "rb"), etag
+    except FileNotFoundError:
+        pass
+
+    # 直接寫進暫存檔再改名，檔案內容不必整份留在記憶體；暫存檔名唯一，同時產生也不會互相覆寫
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f"{name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            build(f)
+        os.replace(tmp_path, path)
+        f = open(path, "rb")
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    prefix, suffix = f"{name}-", f".{fmt}"
+    expired = time.time() - CACHE_GRACE
+    for filename in os.listdir(CACHE_DIR):
+        if filename.startswith(prefix) and filename.endswith(suffix) and filename != os.path.basename(path):
+            old = os.path.join(CACHE_DIR, filename)
+            try:
+                if os.path.getmtime(old) < expired:
+                    os.remove(old)
+            except OSError:
+                pass  # 已被其他請求刪除
+    return f, etag
+
+
+def cached_export(cursor, class_id, class_name, fmt):
+    """單一班級的匯出檔（dictionary cursor）"""
+    version = f"{class_name}:{data_version(cursor, class_id)}"
+    return _cached(f"class-{class_id}", version, fmt,
+                   lambda f: RENDERERS[fmt](build_dataset(cursor, class_id, class_name), f))
+
+
+def cached_bundle(cursor, name, classes, fmt):
+    """
+    多個班級合併的匯出檔（dictionary cursor）
+    classes: [{"class_id", "class_name"}]；任何一班資料變動都會重新產生
+    """
+    version = "|".join(
+        f"{c['class_id']}:{c['class_name']}:{data_version(cursor, c['class_id'])}" for c in classes)
+
+    def build(f):
+        datasets = [build_dataset(cursor, c["class_id"], c["class_name"]) for c in classes]
+        render_many(fmt, datasets, f)
+
+    return _cached(name, version, fmt, build)
@@ -0,0 +1,152 @@
+from datetime import datetime
+
+# =========================================================
+# 志願凍結快照
+#   - 截止後執行 freeze：把每班學生「目前」的志願（含公司、職缺、聯絡資訊）攤平寫入 preference_snapshot_rows
+#     student_preferences 只保留每個志願序的最新值，無法還原過去某個時間點，因此只能凍結當下的內容
+#   - 快照建立後不再修改；同一班再次凍結（re-freeze）會產生新的快照，讀取時以最新一份為準
+#   - unfreeze 刪除班級的所有快照，恢復即時查詢（例如延長截止時間）
+#   - 列以 (snapshot_id, row_no) 為主鍵並依 姓名 / 志願序 編號，匯出一個班只需一次主鍵範圍讀取
+#   - 尚未凍結的班級仍使用即時查詢
+# =========================================================
+
+SNAPSHOT_COLUMNS = (
+    "student_id", "student_name", "student_number", "class_id",
+    "preference_order", "submitted_at",
+    "company_id", "company_name", "company_address", "contact_name", "contact_phone", "contact_email",
+    "job_id", "job_title",
+)
+
+# 即時查詢（未凍結班級使用，也是凍結時的來源）
+LIVE_QUERY = """
+    SELECT
+        u.id AS student_id,
+        u.name AS student_name,
+        u.username AS student_number,
+        u.class_id,
+        sp.preference_order,
+        sp.submitted_at,
+        ic.id AS company_id,
+        ic.company_name,
+        ic.location AS company_address,
+        ic.contact_person AS contact_name,
+        ic.contact_phone,
+        ic.contact_email,
+        ij.id AS job_id,
+        ij.title AS job_title
+    FROM users u
+    LEFT JOIN student_preferences sp ON u.id = sp.student_id
+    LEFT JOIN internship_companies ic ON sp.company_id = ic.id
+    LEFT JOIN internship_jobs ij ON sp.job_id = ij.id
+    WHERE u.class_id = %s AND u.role = 'student'
+    ORDER BY u.name, sp.preference_order
+"""
+
+INSERT_CHUNK = 1000
+
+
+def freeze_class(conn, class_id, created_by=None, cutoff_at=None):
+    """
+    凍結一個班級目前的志願（cutoff_at 只記錄凍結時間，預設為現在）
+    回傳 (snapshot_id, 列數)
+    """
+    cutoff_at = cutoff_at or datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LIVE_QUERY, (class_id,))
+        rows = cursor.fetchall()
+
+        cursor.execute("""
+            INSERT INTO preference_snapshots (class_id, cutoff_at, row_count, created_by)
+            VALUES (%s, %s, %s, %s)
+        """, (class_id, cutoff_at, len(rows), created_by))
+        snapshot_id = cursor.lastrowid
+
+        placeholders = ", ".join(["%s"] * (len(SNAPSHOT_COLUMNS) + 2))
+        sql = f"""
+            INSERT INTO preference_snapshot_rows (snapshot_id, row_no, {", ".join(SNAPSHOT_COLUMNS)})
+            VALUES ({placeholders})
+        """
+        values = [(snapshot_id, row_no) + tuple(row) for row_no, row in enumerate(rows, 1)]
+        for i in range(0, len(values), INSERT_CHUNK):
+            cursor.executemany(sql, values[i:i + INSERT_CHUNK])
+        conn.commit()
+        return snapshot_id, len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _all_class_ids(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM classes ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def freeze_all(conn, created_by=None):
+    """凍結所有班級（凍結時間一致）；回傳 {class_id: (snapshot_id, 列數)}"""
+    cutoff_at = datetime.now()
+    return {class_id: freeze_class(conn, class_id, created_by, cutoff_at) for class_id in _all_class_ids(conn)}
+
+
+def unfreeze_class(conn, class_id):
+    """解除凍結：刪除班級的所有快照，審閱與匯出恢復即時查詢；回傳刪除的快照數"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM preference_snapshots WHERE class_id = %s", (class_id,))
+        snapshot_ids = [row[0] for row in cursor.fetchall()]
+        if snapshot_ids:
+            placeholders = ", ".join(["%s"] * len(snapshot_ids))
+            cursor.execute(f"DELETE FROM preference_snapshot_rows WHERE snapshot_id IN ({placeholders})", snapshot_ids)
+            cursor.execute(f"DELETE FROM preference_snapshots WHERE id IN ({placeholders})", snapshot_ids)
+        conn.commit()
+        return len(snapshot_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def unfreeze_all(conn):
+    """解除所有班級的凍結；回傳 {class_id: 刪除的快照數}"""
+    return {class_id: unfreeze_class(conn, class_id) for class_id in _all_class_ids(conn)}
+
+
+def latest_snapshot(cursor, class_id):
+    """班級最新的快照（dictionary cursor）；尚未凍結回傳 None"""
+    cursor.execute("""
+        SELECT * FROM preference_snapshots
+        WHERE class_id = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """, (class_id,))
+    return cursor.fetchone()
+
+
+def class_preference_rows(cursor, class_id):
+    """
+    班級志願資料（dictionary cursor），欄位同 SNAPSHOT_COLUMNS，依姓名、志願序排序
+    已凍結時讀快照，否則即時查詢；回傳 (snapshot 或 None, rows)
+    """
+    snapshot = latest_snapshot(cursor, class_id)
+    return snapshot, preference_rows(cursor, class_id, snapshot)
+
+
+def preference_rows(cursor, class_id, snapshot):
+    """同 class_preference_rows，但由呼叫端先取得 latest_snapshot 的結果"""
+    if snapshot:
+        cursor.execute(f"""
+            SELECT {", ".join(SNAPSHOT_COLUMNS)}
+            FROM preference_snapshot_rows
+            WHERE snapshot_id = %s
+            ORDER BY row_no
+        """, (snapshot["id"],))
+    else:
+        cursor.execute(LIVE_QUERY, (class_id,))
+    return cursor.fetchall()
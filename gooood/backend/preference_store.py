@@ -0,0 +1,176 @@
+import time
+import mysql.connector
+from mysql.connector import errorcode
+from catalog_cache import bump_version
+
+# =========================================================
+# 學生志願寫入
+#   - 單一交易：鎖定學生的版本列 → 與現有志願比對 → 只寫有變動的志願序
+#   - 每位學生有版本號；表單帶著讀取時的版本送出，版本不符代表別的分頁 / 重複點擊已先寫入
+#   - 遇到 deadlock / lock wait timeout 自動重試
+# =========================================================
+
+MAX_PREFERENCES = 5
+MAX_RETRIES = 3
+RETRY_ERRORS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+
+def class_version_key(class_id):
+    """cache_versions 中班級志願資料的版本名稱（匯出快取以此判斷是否過期）"""
+    return f"class_preferences:{class_id}"
+
+
+class VersionConflict(Exception):
+    """表單版本與資料庫不符（已被其他分頁或重複送出搶先更新）"""
+
+    def __init__(self, current_version):
+        super().__init__(f"志願已更新為版本 {current_version}")
+        self.current_version = current_version
+
+
+def parse_form(form):
+    """從表單取出 {志願序: (company_id, job_id)}；未選公司的志願序略過"""
+    preferences = {}
+    for i in range(1, MAX_PREFERENCES + 1):
+        company_id = form.get(f'company_{i}')
+        if not company_id:
+            continue
+        job_id = form.get(f'job_{i}')
+        preferences[i] = (int(company_id), int(job_id) if job_id else None)
+    return preferences
+
+
+def get_version(cursor, student_id):
+    cursor.execute("SELECT version FROM student_preference_versions WHERE student_id = %s", (student_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+def class_versions(cursor, class_id):
+    """班級每位學生的志願版本 {student_id: version}（未填寫過為 0）"""
+    cursor.execute("""
+        SELECT u.id AS student_id, COALESCE(v.version, 0) AS version
+        FROM users u
+        LEFT JOIN student_preference_versions v ON v.student_id = u.id
+        WHERE u.class_id = %s AND u.role = 'student'
+    """, (class_id,))
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return {row["student_id"]: row["version"] for row in rows}
+    return dict(rows)
+
+
+def load_preferences(cursor, student_id):
+    """回傳 {志願序: (company_id, job_id)}"""
+    cursor.execute("""
+        SELECT preference_order, company_id, job_id
+        FROM student_preferences
+        WHERE student_id = %s
+    """, (student_id,))
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return {r["preference_order"]: (r["company_id"], r["job_id"]) for r in rows}
+    return {order: (company_id, job_id) for order, company_id, job_id in rows}
+
+
+def diff_preferences(current, desired):
+    """回傳 (要刪除的志願序, 要更新的 [(order, company, job)], 要新增的 [(order, company, job)])"""
+    removed = [order for order in current if order not in desired]
+    changed = [(o, c, j) for o, (c, j) in desired.items() if o in current and current[o] != (c, j)]
+    added = [(o, c, j) for o, (c, j) in desired.items() if o not in current]
+    return removed, changed, added
+
+
+def lock_version(cursor, student_id):
+    """以版本列作為每位學生的鎖，同一學生的寫入依序執行；回傳目前版本號"""
+    cursor.execute("""
+        INSERT INTO student_preference_versions (student_id, version) VALUES (%s, 0)
+        ON DUPLICATE KEY UPDATE student_id = student_id
+    """, (student_id,))
+    cursor.execute(
+        "SELECT version FROM student_preference_versions WHERE student_id = %s FOR UPDATE", (student_id,))
+    return cursor.fetchone()[0]
+
+
+def write_diff(cursor, student_id, desired):
+    """
+    在目前交易中把學生志願改成 desired（呼叫端須先 lock_version，並負責 commit）
+    回傳是否有變動；有變動時學生版本號與班級志願版本號都 +1
+    """
+    removed, changed, added = diff_preferences(load_preferences(cursor, student_id), desired)
+    if not (removed or changed or added):
+        return False
+
+    if removed:
+        placeholders = ", ".join(["%s"] * len(removed))
+        cursor.execute(
+            f"DELETE FROM student_preferences WHERE student_id = %s AND preference_order IN ({placeholders})",
+            [student_id] + removed)
+    for order, company_id, job_id in changed:
+        cursor.execute("""
+            UPDATE student_preferences
+            SET company_id = %s, job_id = %s, submitted_at = NOW()
+            WHERE student_id = %s AND preference_order = %s
+        """, (company_id, job_id, student_id, order))
+    if added:
+        cursor.executemany("""
+            INSERT INTO student_preferences (student_id, preference_order, company_id, job_id, submitted_at)
+            VALUES (%s, %s, %s, %s, NOW())
+        """, [(student_id, o, c, j) for o, c, j in added])
+
+    cursor.execute(
+        "UPDATE student_preference_versions SET version = version + 1 WHERE student_id = %s", (student_id,))
+    cursor.execute("SELECT class_id FROM users WHERE id = %s", (student_id,))
+    row = cursor.fetchone()
+    class_id = (row["class_id"] if isinstance(row, dict) else row[0]) if row else None
+    if class_id:
+        bump_version(cursor, class_version_key(class_id))
+    return True
+
+
+def _apply(conn, student_id, desired, expected_version):
+    cursor = conn.cursor()
+    try:
+        conn.rollback()  # 結束連線上可能殘留的隱含交易，確保之後讀到的是鎖定後的最新資料
+        version = lock_version(cursor, student_id)
+        if expected_version is not None and expected_version != version:
+            # 版本不同但內容已與送出的相同（例如重複點擊送出）：視為沒有變動，不算衝突
+            same = load_preferences(cursor, student_id) == desired
+            conn.rollback()
+            if same:
+                return version, False
+            raise VersionConflict(version)
+
+        if not write_diff(cursor, student_id, desired):
+            conn.rollback()
+            return version, False
+        conn.commit()
+        return version + 1, True
+    except VersionConflict:
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def with_retry(fn, *args):
+    """遇到 deadlock / lock wait timeout 時重試整個交易"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return fn(*args)
+        except mysql.connector.Error as e:
+            if e.errno not in RETRY_ERRORS or attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+def save_preferences(conn, student_id, desired, expected_version=None):
+    """
+    寫入學生志願（單一交易，只寫變動的志願序）
+    回傳 (新版本號, 是否有變動)；版本不符時丟出 VersionConflict
+    """
+    return with_retry(_apply, conn, student_id, desired, expected_version)
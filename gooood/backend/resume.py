@@ -237,10 +237,6 @@ def list_resumes(username):
         """, (target_user_id,))
         resumes = cursor.fetchall()
 
-        for r in resumes:
-            if isinstance(r.get('created_at'), datetime):
-                r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-
         cursor.close()
         conn.close()
         return jsonify({"success": True, "resumes": resumes})
@@ -378,10 +374,6 @@ def get_my_resumes():
         """, (user_id,))
         resumes = cursor.fetchall()
 
-        for r in resumes:
-            if isinstance(r.get('upload_time'), datetime):
-                r['upload_time'] = r['upload_time'].strftime("%Y-%m-%d %H:%M:%S")
-
         return jsonify({"success": True, "resumes": resumes})
     
     except Exception as e:
@@ -565,10 +557,6 @@ def get_student_resumes():
         """, (student['student_id'],))
         resumes = cursor.fetchall()
 
-        for r in resumes:
-            if isinstance(r.get('upload_time'), datetime):
-                r['upload_time'] = r['upload_time'].strftime("%Y-%m-%d %H:%M:%S")
-
         return jsonify({"success": True, "resumes": resumes})
 
     except Exception as e:
@@ -744,11 +732,8 @@ def get_class_resumes():
         else:
             return jsonify({"success": False, "message": "無效的角色或權限"}), 403
 
-        # 格式化日期時間並統一字段名稱
+        # 統一字段名稱，確保前端能正確訪問
         for r in resumes:
-            if isinstance(r.get('created_at'), datetime):
-                r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-            # 統一字段名稱，確保前端能正確訪問
             if 'student_name' in r:
                 r['name'] = r['student_name']
             if 'student_number' in r:
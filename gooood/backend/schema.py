@@ -0,0 +1,140 @@
+import traceback
+from config import get_db
+
+# =========================================================
+# 執行期使用的資料表
+#   - 版本號、名額帳本、分發結果、志願版本 / 寫入標記、志願快照等表在這裡集中建立
+#   - MySQL 的 DDL 會隱含 commit 目前的交易，因此不在請求中執行：
+#     部署時執行一次 python schema.py，正式環境啟動（wsgi.py）時也會在 fork worker 之前確認一次
+#   - 只有 CREATE TABLE IF NOT EXISTS，重複執行不影響既有資料
+# =========================================================
+
+TABLES = (
+    # catalog_cache
+    """
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+    # capacity
+    """
+        CREATE TABLE IF NOT EXISTS job_capacity (
+            job_id INT PRIMARY KEY,
+            capacity INT NOT NULL DEFAULT 0,
+            reserved INT NOT NULL DEFAULT 0,
+            placed INT NOT NULL DEFAULT 0,
+            remaining INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS job_slot_ledger (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            job_id INT NOT NULL,
+            student_id INT NULL,
+            action VARCHAR(16) NOT NULL,
+            quantity INT NOT NULL DEFAULT 1,
+            run_id INT NULL,
+            created_by INT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_ledger_job (job_id),
+            KEY idx_ledger_student (student_id)
+        )
+    """,
+    # matching
+    """
+        CREATE TABLE IF NOT EXISTS placement_runs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            algorithm VARCHAR(32) NOT NULL,
+            tie_break VARCHAR(32) NOT NULL,
+            seed BIGINT NOT NULL,
+            student_count INT NOT NULL,
+            placed_count INT NOT NULL,
+            created_by INT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS placement_results (
+            run_id INT NOT NULL,
+            student_id INT NOT NULL,
+            company_id INT NULL,
+            job_id INT NULL,
+            preference_order INT NULL,
+            PRIMARY KEY (run_id, student_id),
+            KEY idx_placement_job (run_id, job_id)
+        )
+    """,
+    # preference_store
+    """
+        CREATE TABLE IF NOT EXISTS student_preference_versions (
+            student_id INT PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+    # preference_buffer
+    """
+        CREATE TABLE IF NOT EXISTS preference_write_marks (
+            student_id INT PRIMARY KEY,
+            submitted_ts DOUBLE NOT NULL
+        )
+    """,
+    # preference_snapshot
+    """
+        CREATE TABLE IF NOT EXISTS preference_snapshots (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            class_id INT NOT NULL,
+            cutoff_at DATETIME NOT NULL,
+            row_count INT NOT NULL DEFAULT 0,
+            created_by INT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_snapshot_class (class_id, id)
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS preference_snapshot_rows (
+            snapshot_id INT NOT NULL,
+            row_no INT NOT NULL,
+            student_id INT NOT NULL,
+            student_name VARCHAR(255) NULL,
+            student_number VARCHAR(255) NULL,
+            class_id INT NULL,
+            preference_order INT NULL,
+            submitted_at DATETIME NULL,
+            company_id INT NULL,
+            company_name VARCHAR(255) NULL,
+            company_address VARCHAR(255) NULL,
+            contact_name VARCHAR(255) NULL,
+            contact_phone VARCHAR(64) NULL,
+            contact_email VARCHAR(255) NULL,
+            job_id INT NULL,
+            job_title VARCHAR(255) NULL,
+            PRIMARY KEY (snapshot_id, row_no)
+        )
+    """,
+)
+
+
+def ensure_schema():
+    """建立缺少的資料表（使用獨立連線，不影響任何進行中的交易）"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        for ddl in TABLES:
+            cursor.execute(ddl)
+        conn.commit()
+        return len(TABLES)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        print(f"✅ 已確認 {ensure_schema()} 個資料表")
+    except Exception:
+        print("❌ 建立資料表失敗：", traceback.format_exc())
+        raise SystemExit(1)
@@ -0,0 +1,51 @@
+import json
+import os
+from avatar import AVATAR_DIR
+
+# =========================================================
+# 帶內容雜湊的靜態檔
+#   - fingerprint_static.py 把靜態檔複製成 assets/<路徑>.<雜湊>.<副檔名>，並寫出 manifest.json
+#   - url_for('static', filename=...) 依 manifest 改寫成帶雜湊的網址（模板不需修改）
+#   - assets/ 底下的檔案內容與網址一一對應，回應 Cache-Control: immutable, max-age=1 年，
+#     重複造訪不再發出任何靜態檔請求
+#   - 沒有 manifest（開發環境、尚未 build）時維持原本的網址
+#   - 以內容雜湊命名的頭像（AVATAR_DIR）同樣以 immutable 快取
+# =========================================================
+
+ASSETS_DIR = "assets"
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE_PREFIXES = (ASSETS_DIR + "/", AVATAR_DIR + "/")
+
+
+def load_manifest(static_folder):
+    """回傳 {原始路徑: 帶雜湊的路徑}；沒有 manifest 時為空 dict"""
+    path = os.path.join(static_folder, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def init_static_assets(app):
+    manifest = load_manifest(app.static_folder)
+    app.config["STATIC_MANIFEST"] = manifest
+
+    if manifest:
+        @app.url_defaults
+        def fingerprint_static_url(endpoint, values):
+            if endpoint == "static" and values.get("filename") in manifest:
+                values["filename"] = manifest[values["filename"]]
+
+    static_view = app.view_functions["static"]
+
+    def static(filename):
+        response = static_view(filename=filename)
+        if filename.startswith(IMMUTABLE_PREFIXES) and response.status_code in (200, 304):
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
+
+    app.view_functions["static"] = static
@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from config import get_db
-import os
+from page_cache import cached_page
+from avatar import AvatarError, MAX_UPLOAD_BYTES, avatar_variants, save_avatar, remove_avatar
+import time
+import traceback
 
 users_bp = Blueprint("users_bp", __name__)
 
@@ -127,6 +129,7 @@ def get_profile():
             is_homeroom = bool(cursor.fetchone())
 
         user["is_homeroom"] = is_homeroom
+        user["avatars"] = avatar_variants(user["avatar_url"])
         user["email"] = user["email"] or ""
 
         # 如果有多班級，拼成一個字串顯示
@@ -213,8 +216,9 @@ def save_profile():
 
 # -------------------------
 # API - 上傳頭像
+#   圖片縮成固定尺寸（WebP + JPEG），檔名為內容雜湊，avatar_url 存 md 尺寸的 WebP
 # -------------------------
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -228,36 +232,47 @@ def upload_avatar():
         return jsonify({"success": False, "message": "沒有檔案"}), 400
 
     file = request.files['avatar']
-    if file and allowed_file(file.filename):
-        filename = secure_filename(f"{session['user_id']}.png")
-        
-        # 確保 avatars 資料夾存在
-        avatars_folder = os.path.join(current_app.static_folder, "avatars")
-        os.makedirs(avatars_folder, exist_ok=True)
-        
-        # 儲存到 static/avatars 資料夾
-        filepath = os.path.join(avatars_folder, filename)
-        file.save(filepath)
-
-        avatar_url = url_for('static', filename=f"avatars/{filename}")
-        
-        # 將頭像URL保存到資料庫
-        conn = get_db()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("UPDATE users SET avatar_url = %s WHERE id = %s", (avatar_url, session['user_id']))
-            conn.commit()
-        except Exception as e:
-            print("❌ 更新頭像URL錯誤:", e)
-            return jsonify({"success": False, "message": "更新頭像URL失敗"}), 500
-        finally:
-            cursor.close()
-            conn.close()
-        
-        return jsonify({"success": True, "avatar_url": avatar_url})
-    else:
+    if not file or not allowed_file(file.filename):
         return jsonify({"success": False, "message": "檔案格式錯誤"}), 400
 
+    data = file.read(MAX_UPLOAD_BYTES + 1)
+    try:
+        relative = save_avatar(current_app.static_folder, data)
+    except AvatarError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception:
+        print("❌ 頭像處理錯誤：", traceback.format_exc())
+        return jsonify({"success": False, "message": "頭像處理失敗"}), 500
+
+    avatar_url = url_for('static', filename=relative)
+
+    # 將頭像URL保存到資料庫；舊頭像沒有其他人使用時刪除檔案
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT avatar_url FROM users WHERE id = %s", (session['user_id'],))
+        row = cursor.fetchone()
+        old_url = row[0] if row else None
+        cursor.execute("UPDATE users SET avatar_url = %s WHERE id = %s", (avatar_url, session['user_id']))
+        conn.commit()
+
+        # 其他人可能在 save_avatar() 之後、UPDATE 之前刪掉了同一張圖的檔案：缺檔時重新產生
+        save_avatar(current_app.static_folder, data)
+
+        if old_url and old_url != avatar_url:
+            checked_at = time.time()
+            cursor.execute("SELECT 1 FROM users WHERE avatar_url = %s LIMIT 1", (old_url,))
+            if not cursor.fetchone():
+                remove_avatar(current_app.static_folder, old_url, checked_at)
+    except Exception as e:
+        print("❌ 更新頭像URL錯誤:", e)
+        return jsonify({"success": False, "message": "更新頭像URL失敗"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    return jsonify({"success": True, "avatar_url": avatar_url, "avatars": avatar_variants(avatar_url)})
+
 # -------------------------
 # API - 變更密碼
 # -------------------------
@@ -307,6 +322,7 @@ def student_home():
 
 # 實習廠商主頁 (新增：對應 visitor_home.html)
 @users_bp.route('/visitor_home')
+@cached_page()
 def visitor_home():
     # 廠商主頁/訪客登入的頁面
     return render_template('visitor_home.html')
@@ -333,15 +349,7 @@ def director_home():
         cursor.close()
         conn.close()
 
-    # 取得待審核公司資料
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, company_name FROM internship_companies WHERE status = 'pending'")
-    companies = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    return render_template("user_shared/director_home.html", companies=companies)
+    return render_template("user_shared/director_home.html")
 
 # 科助
 @users_bp.route('/ta_home')
@@ -353,10 +361,28 @@ def ta_home():
 def manage_companies():
     return render_template('user_shared/manage_companies.html')
 
-# 志願序最終結果
+# 志願序最終結果（最新一次分發）
+#   主任 / 科助 / 管理員看全部學生；學生只看自己的分發結果
 @users_bp.route('/final_results')
 def final_results():
-    return render_template('user_shared/final_results.html')
+    if 'user_id' not in session:
+        return redirect(url_for('auth_bp.login_page'))
+    role = session.get('role')
+    if role not in ('director', 'ta', 'admin', 'student'):
+        return "沒有權限查看分發結果", 403
+
+    from matching import load_latest_results
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # 學生只查自己的結果
+        run, placements = load_latest_results(cursor, session['user_id'] if role == 'student' else None)
+    finally:
+        cursor.close()
+        conn.close()
+
+    return render_template('user_shared/final_results.html', run=run, placements=placements)
 
 # 管理員首頁（後台）
 @users_bp.route('/admin_home')
@@ -0,0 +1,27 @@
+import gc
+from app import create_app, warm_up
+from pdf_report import register_fonts
+from preference_buffer import recover_journals
+from schema import ensure_schema
+
+# =========================================================
+# 正式環境入口（gunicorn -c gunicorn.conf.py）
+#   - preload_app：主程序先匯入所有 Blueprint、編譯模板，再 fork 出 worker
+#   - 關閉模板 auto_reload：模板載入後不再逐次檢查檔案修改時間
+#   - gc.freeze()：把目前的物件移出 GC 追蹤，worker 做 GC 時不會寫到這些頁面，
+#     copy-on-write 共用的記憶體不會被逐頁複製
+#   - PDF 中文字型在這裡註冊一次（找不到可嵌入的字型時啟動時就會印出警告）
+#   - 執行期資料表（schema.py）在這裡確認一次；上一次執行留下的志願日誌檔在這裡寫入資料庫；
+#     用完的連線在 fork 前就關閉
+#   - 其餘資料庫連線不在主程序建立（連線不能跨 fork 共用），由 worker 在請求時各自 get_db()
+# =========================================================
+
+ensure_schema()
+recover_journals()
+app = create_app()
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+print(f"✅ 已預先編譯 {warm_up(app)[0]} 個模板")
+register_fonts()
+
+gc.freeze()